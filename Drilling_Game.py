@@ -1,8 +1,48 @@
 import os
+import sys
+import re
+import shutil
 import json
 import datetime
 import time
 import random
+import contextlib
+import copy
+import io
+import functools
+import argparse
+import math
+import bisect
+import struct
+import hashlib
+import sqlite3
+import asyncio
+import threading
+import mmap
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+from dataclasses import dataclass, field
+
+try:
+    import termios
+    import tty
+    import select
+except ImportError:  # Windows
+    termios = None
+try:
+    import fcntl
+except ImportError:  # Windows, saves are locked with msvcrt instead
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, bulk mining falls back to pure Python
+    np = None
 
 class Color:
     PURPLE = '\033[95m'
@@ -13,10 +53,1092 @@ class Color:
     END = '\033[0m'
     BOLD = '\033[1m'
 
+def atomic_write(path, text):
+    # Write to a temp file, fsync, then rename so a crash never truncates the save
+    tmp_path = f"{path}.tmp"
+    payload = text.encode() if isinstance(text, str) else text
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    PROFILER.count("save.bytes", len(payload))
+
+class SaveLock:
+    # Side file next to a save shared by every process using it: an advisory lock plus the
+    # save's generation counter, memory-mapped so spotting another process's save is a memory read
+    COUNTER = struct.Struct("<Q")
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.mutex = threading.Lock()  # The OS lock belongs to the open file, so threads need this too
+
+    def open(self):
+        if self.map is None and self.file is None:
+            try:
+                self.file = open(self.path, 'a+b')
+                if os.fstat(self.file.fileno()).st_size < self.COUNTER.size:
+                    self.file.write(bytes(self.COUNTER.size))
+                    self.file.flush()
+                self.map = mmap.mmap(self.file.fileno(), self.COUNTER.size)
+            except (OSError, ValueError):
+                # Read-only directory and the like: saves still work, just without the protection
+                self.map = None
+        return self.map
+
+    @contextlib.contextmanager
+    def hold(self):
+        with self.mutex:
+            if self.open() is None:
+                yield
+                return
+            fd = self.file.fileno()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            elif msvcrt:
+                os.lseek(fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:  # Gave up after ten seconds, keep waiting
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                elif msvcrt:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def generation(self):
+        counter = self.open()
+        return self.COUNTER.unpack_from(counter)[0] if counter is not None else None
+
+    def bump(self):
+        """Advance the generation; call with the lock held, before writing the save."""
+        generation = self.generation()
+        if generation is None:
+            return None
+        self.COUNTER.pack_into(self.map, 0, generation + 1)
+        return generation + 1
+
+class Profiler:
+    # Opt-in counters and timers; every hook is a cheap no-op while disabled
+    EDGES = (0.0001, 0.001, 0.01, 0.1, 1.0)  # Latency histogram bucket limits in seconds
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.timers = {}  # name -> [count, total, max, buckets]
+        self.cprofile = None
+        self.started = time.perf_counter()
+
+    def enable(self, cprofile=False):
+        self.enabled = True
+        self.started = time.perf_counter()
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0, 0.0, [0] * (len(self.EDGES) + 1)]
+        timer[0] += 1
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+        timer[3][bisect.bisect_left(self.EDGES, seconds)] += 1
+
+    @contextlib.contextmanager
+    def _timing(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timer(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timing(name)
+
+    def timed(self, name):
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def report(self):
+        buckets = [f"<{edge * 1000:g}ms" for edge in self.EDGES] + [f">={self.EDGES[-1] * 1000:g}ms"]
+        return {
+            "seconds": time.perf_counter() - self.started,
+            "counters": dict(self.counters),
+            "timers": {name: {"count": count, "total_ms": total * 1000,
+                              "mean_ms": total / count * 1000 if count else 0.0,
+                              "max_ms": peak * 1000, "histogram": dict(zip(buckets, hist))}
+                       for name, (count, total, peak, hist) in sorted(self.timers.items())},
+        }
+
+    def summary_lines(self):
+        report = self.report()
+        lines = [f"Profile over {report['seconds']:.1f}s",
+                 f"{'timer':<22} {'count':>9} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, timer in report["timers"].items():
+            lines.append(f"{name:<22} {timer['count']:>9} {timer['total_ms']:>10.1f} "
+                         f"{timer['mean_ms']:>9.3f} {timer['max_ms']:>9.3f}")
+        for name, value in sorted(report["counters"].items()):
+            lines.append(f"{name:<22} {value:>9}")
+        return lines
+
+    def dump(self, prefix):
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.json", 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+PROFILER = Profiler()
+
+def op_root(kind, key):
+    """Top-level save key an op changes."""
+    if kind == "inv":
+        return "inventory"
+    return key if isinstance(key, str) else key[0]
+
+def fold_decaying(entry, amount, when, rate):
+    """Add `amount` at time `when` to a total [amount, when] that decays at `rate` per second."""
+    if not entry:
+        return [amount, when]
+    total, since = entry
+    # Kept at the later of the two times, so folds give the same total in any order
+    if when >= since:
+        return [total * math.exp(-rate * (when - since)) + amount, when]
+    return [total + amount * math.exp(-rate * (since - when)), since]
+
+def apply_op(data, op):
+    kind, key, value = op
+    if not isinstance(key, str):
+        # A path into nested dicts, e.g. ["stats", "ores", "Gold"]
+        *parents, key = key
+        for part in parents:
+            data = data.setdefault(part, {})
+    if kind == "set":
+        data[key] = value
+    elif kind == "add":
+        data[key] = data.get(key, 0) + value
+    elif kind == "decay":
+        data[key] = fold_decaying(data.get(key), *value)
+    elif kind == "inv":
+        inventory = data.setdefault("inventory", {})
+        inventory[key] = inventory.get(key, 0) + value
+        if inventory[key] <= 0:
+            inventory.pop(key)
+
+class SaveChanges:
+    # What this process changed since its last save, kept as deltas so they can be replayed on
+    # top of a save another process wrote in the meantime: counters and inventory counts add up,
+    # decaying totals fold together, anything that was set outright takes this process's value.
+    # Keys are paths, so nested fields like ("stats", "ores", "Gold") merge one by one
+    def __init__(self):
+        self.sets = set()
+        self.adds = {}
+        self.decays = {}  # Path -> ([amount, when] of our additions, rate)
+        self.inventory = {}
+
+    def __bool__(self):
+        return bool(self.sets or self.adds or self.decays or self.inventory)
+
+    def note(self, kind, key, value):
+        if kind == "inv":
+            self.inventory[key] = self.inventory.get(key, 0) + value
+            return
+        path = (key,) if isinstance(key, str) else tuple(key)
+        if kind == "add":
+            self.adds[path] = self.adds.get(path, 0) + value
+        elif kind == "decay":
+            amount, when, rate = value
+            entry = self.decays.get(path, (None, rate))[0]
+            self.decays[path] = (fold_decaying(entry, amount, when, rate), rate)
+        else:
+            self.sets.add(path)
+
+    def covered(self, path, strict=False):
+        # Whether a set of the path itself (unless strict) or of a parent replaced it wholesale
+        return any(path[:depth] in self.sets for depth in range(1, len(path) + (not strict)))
+
+    @staticmethod
+    def parent(merged, path, copied):
+        # The dict holding path[-1]; containers on the way are copied once, since the
+        # originals may be shared with a snapshot still waiting to be written
+        node = merged
+        for depth, part in enumerate(path[:-1], 1):
+            child = node.get(part)
+            if isinstance(child, LazySection):
+                child = child.load()
+            if path[:depth] not in copied:
+                child = dict(child or {})
+                node[part] = child
+                copied.add(path[:depth])
+            node = child
+        return node
+
+    def combine(self, later):
+        self.sets |= later.sets
+        for key, value in later.adds.items():
+            self.adds[key] = self.adds.get(key, 0) + value
+        for key, ((amount, when), rate) in later.decays.items():
+            entry = self.decays.get(key, (None, rate))[0]
+            self.decays[key] = (fold_decaying(entry, amount, when, rate), rate)
+        for key, value in later.inventory.items():
+            self.inventory[key] = self.inventory.get(key, 0) + value
+        return self
+
+    def apply(self, theirs, ours):
+        """Return `theirs` with these changes replayed on it, taking set values from `ours`."""
+        merged = dict(theirs)
+        copied = set()
+        for path in self.sets:
+            if self.covered(path, strict=True):
+                continue  # Comes along with its parent
+            value = ours
+            for part in path:
+                value = value.get(part) if isinstance(value, dict) else None
+            self.parent(merged, path, copied)[path[-1]] = value
+        for path, value in self.adds.items():
+            if not self.covered(path):
+                node = self.parent(merged, path, copied)
+                node[path[-1]] = node.get(path[-1], 0) + value
+        for path, ((amount, when), rate) in self.decays.items():
+            if not self.covered(path):
+                node = self.parent(merged, path, copied)
+                node[path[-1]] = fold_decaying(node.get(path[-1]), amount, when, rate)
+        if self.inventory and not self.covered(("inventory",)):
+            inventory = theirs.get("inventory", {})
+            inventory = dict(inventory.load() if isinstance(inventory, LazySection) else inventory)
+            for name, value in self.inventory.items():
+                count = inventory.get(name, 0) + value
+                if count > 0:
+                    inventory[name] = count
+                else:
+                    inventory.pop(name, None)
+            merged["inventory"] = inventory
+        return merged
+
+class Storage:
+    # Where a profile lives. commit() gets the full state plus the changes since the last commit
+    wants_ops = False
+    history_dir = None  # Where the per-dig history goes, None keeps no history
+    board_key = None  # (source, profile) row on the leaderboard, None keeps it off the board
+    save_lock = None  # SaveLock for saves other processes may write too
+    read_only = False  # Leave unreadable or torn files as they are, for tools reading others' saves
+
+    def load(self):
+        return None
+
+    def write(self, data):
+        pass
+
+    def commit(self, data, ops):
+        self.write(data)
+
+    def delete(self):
+        pass
+
+class JsonStorage(Storage):
+    # The snapshot counts the journals folded into it and a journal opens with the count it
+    # applies on top of, so one left behind by a crash mid-compaction is never replayed twice
+    JOURNAL_KEY = "journal_seq"
+
+    def __init__(self, file_path='user_data.json', journal=False, compact_threshold=64 * 1024):
+        self.file_path = file_path
+        self.journal = journal
+        self.wants_ops = journal
+        self.journal_path = f"{file_path}.journal"
+        self.journal_seq = 0  # Journals folded into the snapshot on disk
+        self.history_dir = f"{file_path}.history"
+        self.board_key = (os.path.abspath(file_path), "")
+        self.compact_threshold = compact_threshold
+        self.save_lock = SaveLock(f"{file_path}.lock")
+
+    def load(self):
+        data = None
+        if os.path.exists(self.file_path):
+            try:
+                with open(self.file_path, 'r') as file:
+                    data = json.load(file)
+                self.journal_seq = data.pop(self.JOURNAL_KEY, 0)
+            except (OSError, ValueError, AttributeError):
+                if self.read_only:
+                    return None
+                # Keep the unreadable save around instead of silently losing it
+                backup = f"{self.file_path}.corrupt"
+                with contextlib.suppress(OSError):
+                    os.replace(self.file_path, backup)
+                print(f"{Color.RED}Save file is unreadable, moved it to {backup}{Color.END}")
+        if os.path.exists(self.journal_path):
+            data = data if data is not None else {}
+            self.replay_journal(data)
+        return data
+
+    def replay_journal(self, data):
+        good_size = 0
+        stale = False
+        with open(self.journal_path, 'rb') as file:
+            for line in file:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break
+                if isinstance(op, dict):
+                    # Header; journals from before it existed apply to a snapshot that never compacted
+                    stale = op.get("base") != self.journal_seq
+                    if stale:
+                        break
+                else:
+                    apply_op(data, op)
+                good_size += len(line)
+        if self.read_only:
+            return
+        if stale or not good_size:
+            # The snapshot already holds these records, the crash came before the journal was removed;
+            # or nothing of it survived, and the next append must start with a header again
+            os.remove(self.journal_path)
+        elif good_size < os.path.getsize(self.journal_path):
+            # Drop a torn final record left by an interrupted append
+            os.truncate(self.journal_path, good_size)
+
+    def write(self, data):
+        # A journal on disk is folded into this snapshot, so it must not be replayed onto it
+        seq = self.journal_seq + os.path.exists(self.journal_path)
+        atomic_write(self.file_path, json.dumps({**data, self.JOURNAL_KEY: seq} if seq else data))
+        self.journal_seq = seq
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.journal_path)
+
+    def commit(self, data, ops):
+        if not self.journal:
+            self.write(data)
+            return
+        if ops:
+            try:
+                empty = not os.path.getsize(self.journal_path)
+            except FileNotFoundError:
+                empty = True
+            # Also on an empty file: an append torn before its first record left one behind
+            header = json.dumps({"base": self.journal_seq}) + "\n" if empty else ""
+            with open(self.journal_path, 'ab') as file:
+                text = header + "".join(json.dumps(op, separators=(',', ':')) + "\n" for op in ops)
+                payload = text.encode()
+                file.write(payload)
+                file.flush()
+                os.fsync(file.fileno())
+            PROFILER.count("save.bytes", len(payload))
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > self.compact_threshold:
+            # Fold the journal into a fresh snapshot
+            self.write(data)
+
+    def delete(self):
+        for path in (self.file_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+_sqlite_connections = {}
+
+class LazySection:
+    # A save section read from disk only when something first asks for it
+    def __init__(self, path, offset, length, decode, file=None):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.decode = decode
+        self.file = file  # Handle the header was read from, None to reopen the path
+        self.payload = None
+
+    def raw(self):
+        if self.payload is None:
+            if self.file is not None and hasattr(os, "pread"):
+                self.payload = os.pread(self.file.fileno(), self.length, self.offset)
+            else:
+                with open(self.path, 'rb') as file:
+                    file.seek(self.offset)
+                    self.payload = file.read(self.length)
+        return self.payload
+
+    def load(self):
+        return self.decode(self.raw())
+
+def encode_inventory(inventory):
+    # Interned ore-name table followed by packed (ore id, count) pairs
+    names = list(inventory)
+    parts = [struct.pack("<I", len(names))]
+    for name in names:
+        encoded = name.encode()
+        parts.append(struct.pack("<H", len(encoded)) + encoded)
+    parts.append(struct.pack(f"<{2 * len(names)}q", *(n for pair in enumerate(inventory.values()) for n in pair)))
+    return b"".join(parts)
+
+def decode_inventory(payload):
+    (count,), offset = struct.unpack_from("<I", payload), 4
+    names = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", payload, offset)
+        names.append(payload[offset + 2:offset + 2 + length].decode())
+        offset += 2 + length
+    pairs = struct.unpack_from(f"<{2 * count}q", payload, offset)
+    return {names[ore_id]: n for ore_id, n in zip(pairs[::2], pairs[1::2])}
+
+class BinaryStorage(Storage):
+    # Packed save: fixed fields in a struct header, every other key in its own lazily read section
+    MAGIC = b"DRLG"
+    HEADER = struct.Struct("<4sHqiiiqB")  # magic, version, coins, luck, energy, max_energy, drills_used, flags
+    FIELDS = ("coins", "luck", "energy", "max_energy", "drills_used")
+    FLAGS = ("instant_mining", "auto_drill")
+    STRINGS = ("name", "drill", "last_played")
+    SECTION = struct.Struct("<BII")  # kind, offset, length; followed by the key
+    JSON_SECTION, INVENTORY_SECTION = 0, 1
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.history_dir = f"{file_path}.history"
+        self.board_key = (os.path.abspath(file_path), "")
+        self.save_lock = SaveLock(f"{file_path}.lock")
+
+    def load(self):
+        try:
+            # Left open for the lazy sections where pread exists: they keep reading this
+            # file even after another process has renamed a newer save over it
+            file = open(self.file_path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            return self.read_header(file)
+        except (OSError, struct.error, UnicodeDecodeError, ValueError):
+            file.close()
+            if self.read_only:
+                return None
+            backup = f"{self.file_path}.corrupt"
+            with contextlib.suppress(OSError):
+                os.replace(self.file_path, backup)
+            print(f"{Color.RED}Save file is unreadable, moved it to {backup}{Color.END}")
+            return None
+        finally:
+            if not hasattr(os, "pread"):
+                file.close()
+
+    def read_header(self, file):
+        magic, version, *values = self.HEADER.unpack(file.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError("not a binary save")
+        *numbers, flags = values
+        data = {"version": version, **dict(zip(self.FIELDS, numbers))}
+        for i, key in enumerate(self.FLAGS):
+            data[key] = bool(flags & (1 << i))
+        for key in self.STRINGS:
+            (length,) = struct.unpack("<H", file.read(2))
+            data[key] = file.read(length).decode()
+        (sections,) = struct.unpack("<H", file.read(2))
+        for _ in range(sections):
+            kind, offset, length = self.SECTION.unpack(file.read(self.SECTION.size))
+            (key_length,) = struct.unpack("<H", file.read(2))
+            key = file.read(key_length).decode()
+            decode = decode_inventory if kind == self.INVENTORY_SECTION else json.loads
+            data[key] = LazySection(self.file_path, offset, length, decode,
+                                    file if hasattr(os, "pread") else None)
+        return data
+
+    def write(self, data):
+        flags = sum(1 << i for i, key in enumerate(self.FLAGS) if data.get(key))
+        head = [self.HEADER.pack(self.MAGIC, data.get("version", SAVE_VERSION),
+                                 *(int(data.get(key, 0)) for key in self.FIELDS), flags)]
+        for key in self.STRINGS:
+            encoded = str(data.get(key, "")).encode()
+            head.append(struct.pack("<H", len(encoded)) + encoded)
+        fixed = {"version", *self.FIELDS, *self.FLAGS, *self.STRINGS}
+        sections = []
+        for key, value in data.items():
+            if key in fixed:
+                continue
+            if isinstance(value, LazySection):
+                # Untouched sections are copied as-is without decoding them
+                kind = self.INVENTORY_SECTION if value.decode is decode_inventory else self.JSON_SECTION
+                sections.append((key, kind, value.raw()))
+            elif key == "inventory" and all(type(n) is int for n in value.values()):
+                sections.append((key, self.INVENTORY_SECTION, encode_inventory(value)))
+            else:
+                sections.append((key, self.JSON_SECTION, json.dumps(value).encode()))
+        head.append(struct.pack("<H", len(sections)))
+        table_size = sum(self.SECTION.size + 2 + len(key.encode()) for key, _, _ in sections)
+        offset = sum(len(part) for part in head) + table_size
+        for key, kind, payload in sections:
+            encoded = key.encode()
+            head.append(self.SECTION.pack(kind, offset, len(payload)) + struct.pack("<H", len(encoded)) + encoded)
+            offset += len(payload)
+        atomic_write(self.file_path, b"".join(head + [payload for _, _, payload in sections]))
+
+    def delete(self):
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+def detect_save_format(path):
+    """Return "binary" or "json" for an existing save, None when there is none."""
+    try:
+        with open(path, 'rb') as file:
+            return "binary" if file.read(len(BinaryStorage.MAGIC)) == BinaryStorage.MAGIC else "json"
+    except FileNotFoundError:
+        return None
+
+class MiningHistory:
+    # Append-only per-dig log kept in typed arrays and stored as column files in fixed-size chunks
+    CHUNK = 1 << 16  # Digs per chunk file
+    COLUMNS = (("ore", "H"), ("event", "B"), ("luck", "B"), ("time", "I"))  # 8 bytes per dig
+    EVENT_CODES = {None: 0, "bonus": 1, "energy": 2, "double": 3, "empty": 4}
+    MAX_LUCK = 255  # The luck column is one byte; content may not allow more
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = {name: array(code) for name, code in self.COLUMNS}
+        self.names = None  # Interned ore names, the ore column stores indexes into this
+        self.ids = {}
+        self.stored = None  # Digs already on disk, found on the first flush
+        self.queued = 0  # Digs taken by a background saver but not written yet
+        self.lock = threading.Lock()  # The saver thread writes while the main thread counts
+
+    def column_path(self, chunk, column):
+        return os.path.join(self.directory, f"{chunk:06d}.{column}")
+
+    def ore_ids(self):
+        if self.names is None:
+            try:
+                with open(os.path.join(self.directory, "ores.json")) as file:
+                    self.names = json.load(file)
+            except (OSError, ValueError):
+                self.names = []
+            self.ids = {name: i for i, name in enumerate(self.names)}
+        return self.ids
+
+    def extend(self, luck, digs, when=None):
+        """Queue a batch of DigResults mined at `luck`; flush() writes them out."""
+        ids = self.ore_ids()
+        names = [dig.ore.name for dig in digs]
+        for name in sorted(set(names).difference(ids)):
+            ids[name] = len(self.names)
+            self.names.append(name)
+        pending = self.pending
+        pending["ore"].extend(map(ids.__getitem__, names))
+        pending["event"].extend(map(self.EVENT_CODES.__getitem__, [dig.event for dig in digs]))
+        pending["luck"].extend(array("B", [luck]) * len(digs))
+        pending["time"].extend(array("I", [int(when or time.time())]) * len(digs))
+
+    def count_stored(self, repair=False):
+        # Size of the last chunk, by its shortest column; repair cuts a torn append back to that
+        chunks = sorted(int(name.split(".")[0]) for name in os.listdir(self.directory) if name.endswith(".ore"))
+        if not chunks:
+            return 0
+        last = chunks[-1]
+        sizes = {}
+        for name, code in self.COLUMNS:
+            path = self.column_path(last, name)
+            sizes[name] = os.path.getsize(path) // array(code).itemsize if os.path.exists(path) else 0
+        used = min(sizes.values())
+        for name, code in self.COLUMNS:
+            if repair and sizes[name] > used:
+                os.truncate(self.column_path(last, name), used * array(code).itemsize)
+        return last * self.CHUNK + used
+
+    def take(self):
+        """Hand over the queued digs (with the name table they refer to) for write()."""
+        batch = self.pending
+        batch["names"] = list(self.names or ())
+        self.pending = {name: array(code) for name, code in self.COLUMNS}
+        with self.lock:
+            self.queued += len(batch["ore"])
+        return batch
+
+    def restore(self, batch):
+        # A batch that couldn't be written goes back in front of the queue
+        for name, _ in self.COLUMNS:
+            batch[name].extend(self.pending[name])
+            self.pending[name] = batch[name]
+        with self.lock:
+            self.queued -= len(batch["ore"])
+
+    def write(self, batch):
+        """Append a batch from take(); call with the save's lock held."""
+        total = len(batch["ore"])
+        if not total:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Other processes may append to the same history: go by the files, not by our last write
+        stored = self.count_stored(repair=True)
+        try:
+            with open(os.path.join(self.directory, "ores.json")) as file:
+                names = json.load(file)
+        except (OSError, ValueError):
+            names = []
+        columns = dict(batch)
+        ours = batch["names"]
+        if names[:len(ours)] != ours[:len(names)]:
+            # Their name table grew differently from ours: renumber our ore column to theirs
+            index = {name: i for i, name in enumerate(names)}
+            for name in ours:
+                if name not in index:
+                    index[name] = len(names)
+                    names.append(name)
+            columns["ore"] = array("H", map([index[name] for name in ours].__getitem__, batch["ore"]))
+        elif len(ours) > len(names):
+            names = ours
+        atomic_write(os.path.join(self.directory, "ores.json"), json.dumps(names))
+        done = 0
+        while done < total:
+            chunk, used = divmod(stored, self.CHUNK)
+            take = min(self.CHUNK - used, total - done)
+            for name, _ in self.COLUMNS:
+                with open(self.column_path(chunk, name), 'ab') as file:
+                    columns[name][done:done + take].tofile(file)
+            stored += take
+            done += take
+        # Both at once, so len() never counts a dig twice or not at all
+        with self.lock:
+            self.stored = stored
+            self.queued -= total
+        # Emptied once on disk, so retrying a save that failed later on won't append it twice
+        for name, _ in self.COLUMNS:
+            del batch[name][:]
+
+    def __len__(self):
+        with self.lock:
+            if self.stored is None:
+                self.stored = self.count_stored() if os.path.isdir(self.directory) else 0
+            return self.stored + len(self.pending["ore"]) + self.queued
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.pending = {name: array(code) for name, code in self.COLUMNS}
+        self.names = None
+        with self.lock:
+            self.stored = 0
+
+def sqlite_connection(db_path, schema=None):
+    # One shared connection per database file per process
+    key = os.path.abspath(db_path)
+    conn = _sqlite_connections.get(key)
+    if conn is None:
+        conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(schema or SqliteStorage.SCHEMA)
+        _sqlite_connections[key] = conn
+    return conn
+
+class SqliteStorage(Storage):
+    # Many profiles in one database: a player row, inventory rows and counter rows
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            profile TEXT PRIMARY KEY,
+            name TEXT, coins INTEGER, luck INTEGER, energy INTEGER, max_energy INTEGER,
+            drill TEXT, drills_used INTEGER, last_played TEXT, extra TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS inventory (
+            profile TEXT NOT NULL, ore TEXT NOT NULL, count INTEGER NOT NULL,
+            PRIMARY KEY (profile, ore)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS counters (
+            profile TEXT NOT NULL, key TEXT NOT NULL, value REAL NOT NULL,
+            PRIMARY KEY (profile, key)
+        ) WITHOUT ROWID;
+    """
+    COLUMNS = ("name", "coins", "luck", "energy", "max_energy", "drill", "drills_used", "last_played")
+    # Fixed statement text so sqlite3's statement cache reuses the prepared statements
+    SET_COLUMN = {column: f"UPDATE players SET {column} = ? WHERE profile = ?" for column in COLUMNS}
+    ADD_COLUMN = {column: f"UPDATE players SET {column} = {column} + ? WHERE profile = ?" for column in COLUMNS}
+    UPSERT_PLAYER = (f"INSERT OR REPLACE INTO players (profile, {', '.join(COLUMNS)}, extra) "
+                     f"VALUES (?, {', '.join('?' * len(COLUMNS))}, ?)")
+    ADD_INVENTORY = ("INSERT INTO inventory (profile, ore, count) VALUES (?, ?, ?) "
+                     "ON CONFLICT (profile, ore) DO UPDATE SET count = count + excluded.count")
+    PRUNE_INVENTORY = "DELETE FROM inventory WHERE profile = ? AND ore = ? AND count <= 0"
+    SET_COUNTER = "INSERT OR REPLACE INTO counters (profile, key, value) VALUES (?, ?, ?)"
+    ADD_COUNTER = ("INSERT INTO counters (profile, key, value) VALUES (?, ?, ?) "
+                   "ON CONFLICT (profile, key) DO UPDATE SET value = value + excluded.value")
+    SET_EXTRA = "UPDATE players SET extra = ? WHERE profile = ?"
+    wants_ops = True
+
+    def __init__(self, db_path, profile):
+        self.db_path = db_path
+        self.profile = profile
+        self.history_dir = os.path.join(f"{db_path}.history", profile)
+        self.board_key = (os.path.abspath(db_path), profile)
+        self.conn = sqlite_connection(db_path)
+        self.extra = {}
+        self.exists = False
+
+    def load(self):
+        row = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)}, extra FROM players WHERE profile = ?", (self.profile,)).fetchone()
+        if row is None:
+            return None
+        self.exists = True
+        data = dict(zip(self.COLUMNS, row))
+        self.extra = json.loads(row[-1])
+        data.update(self.extra)
+        data["inventory"] = dict(self.conn.execute(
+            "SELECT ore, count FROM inventory WHERE profile = ?", (self.profile,)))
+        for key, value in self.conn.execute("SELECT key, value FROM counters WHERE profile = ?", (self.profile,)):
+            data[key] = int(value) if value == int(value) else value
+        return data
+
+    @classmethod
+    def split(cls, data):
+        # Player columns, numeric counters, and everything else as JSON
+        counters = {}
+        extra = {}
+        for key, value in data.items():
+            if key in cls.COLUMNS or key == "inventory":
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                counters[key] = value
+            else:
+                extra[key] = value
+        return counters, extra
+
+    def write(self, data):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.write_rows(self.conn, self.profile, data)
+        self.exists = True
+        self.extra = self.split(data)[1]
+
+    @classmethod
+    def write_rows(cls, conn, profile, data):
+        counters, extra = cls.split(data)
+        conn.execute(cls.UPSERT_PLAYER, (profile, *(data.get(column) for column in cls.COLUMNS), json.dumps(extra)))
+        conn.execute("DELETE FROM inventory WHERE profile = ?", (profile,))
+        conn.executemany("INSERT INTO inventory (profile, ore, count) VALUES (?, ?, ?)",
+                         [(profile, ore, count) for ore, count in data.get("inventory", {}).items()])
+        conn.execute("DELETE FROM counters WHERE profile = ?", (profile,))
+        conn.executemany(cls.SET_COUNTER, [(profile, key, value) for key, value in counters.items()])
+
+    def commit(self, data, ops):
+        if not self.exists:
+            self.write(data)
+            return
+        conn = self.conn
+        profile = self.profile
+        extra = False  # Whether the JSON column needs rewriting
+        with conn:
+            conn.execute("BEGIN")
+            for kind, key, value in ops:
+                if not isinstance(key, str):
+                    # Nested fields live in the JSON column, which is rewritten whole anyway
+                    self.extra[key[0]] = data.get(key[0])
+                    extra = True
+                elif kind == "inv":
+                    conn.execute(self.ADD_INVENTORY, (profile, key, value))
+                    conn.execute(self.PRUNE_INVENTORY, (profile, key))
+                elif key == "inventory":
+                    conn.execute("DELETE FROM inventory WHERE profile = ?", (profile,))
+                    conn.executemany(self.ADD_INVENTORY, [(profile, ore, n) for ore, n in value.items()])
+                elif key in self.COLUMNS:
+                    conn.execute((self.SET_COLUMN if kind == "set" else self.ADD_COLUMN)[key], (value, profile))
+                elif kind == "add" or isinstance(value, (int, float)) and not isinstance(value, bool):
+                    conn.execute(self.ADD_COUNTER if kind == "add" else self.SET_COUNTER, (profile, key, value))
+                else:
+                    self.extra[key] = value
+                    extra = True
+            if extra:
+                conn.execute(self.SET_EXTRA, (json.dumps(self.extra), profile))
+        PROFILER.count("save.ops", len(ops))
+
+    def delete(self):
+        with self.conn:
+            conn = self.conn
+            conn.execute("BEGIN")
+            for table in ("players", "inventory", "counters"):
+                conn.execute(f"DELETE FROM {table} WHERE profile = ?", (self.profile,))
+        self.exists = False
+        self.extra = {}
+
+    @staticmethod
+    def profiles(db_path):
+        return sqlite_connection(db_path).execute(
+            "SELECT profile, name, coins, luck, drill, drills_used FROM players ORDER BY profile").fetchall()
+
+def profile_name(path):
+    # alice.json -> alice, alice/user_data.json -> alice
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem == "user_data":
+        return os.path.basename(os.path.dirname(os.path.abspath(path))) or stem
+    return stem
+
+def read_save(path):
+    """Load a save of either format in full without changing any file, None when unreadable."""
+    storage = BinaryStorage(path) if detect_save_format(path) == "binary" else JsonStorage(path)
+    storage.read_only = True
+    data = storage.load()
+    if data is None:
+        return None
+    return {key: value.load() if isinstance(value, LazySection) else value for key, value in data.items()}
+
+def migrate_json_saves(db_path, paths):
+    """Import JSON or binary saves into the SQLite database in one transaction.
+
+    Raises ValueError, importing nothing, when two saves would land in the same profile.
+    """
+    sources = {}
+    for path in paths:
+        sources.setdefault(profile_name(path), []).append(path)
+    clashes = [f"{', '.join(clash)} -> {profile}" for profile, clash in sources.items() if len(clash) > 1]
+    if clashes:
+        raise ValueError("Saves share a profile name, rename them first: " + "; ".join(clashes))
+    conn = sqlite_connection(db_path)
+    defaults = UserDataManager(None)
+    imported = []
+    with conn:
+        conn.execute("BEGIN")
+        for path in paths:
+            data = read_save(path)
+            if data is None:
+                print(f"{Color.YELLOW}Skipped {path}: no readable save{Color.END}")
+                continue
+            profile = profile_name(path)
+            SqliteStorage.write_rows(conn, profile, defaults.upgrade(data))
+            imported.append(profile)
+    return imported
+
+class BackgroundSaver:
+    # Writes saves on a worker thread. A snapshot still waiting is replaced by the newer one;
+    # journal ops and history rows are appended so nothing is dropped
+    def __init__(self, commit, history=None):
+        self.commit = commit
+        self.history = history
+        self.cond = threading.Condition()
+        self.pending = None  # [snapshot, ops, history batch, SaveChanges]
+        self.failed = None  # Last job that couldn't be written, retried with the next one
+        self.busy = False
+        self.errors = []
+        self.merged = None  # Save merged with another process's, for the main thread to adopt
+        self.thread = threading.Thread(target=self.run, name="saver", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def merge(job, snapshot, ops, batch, changes):
+        if job is None:
+            return [snapshot, list(ops), batch, changes]
+        job[0] = snapshot
+        job[1].extend(ops)
+        job[3].combine(changes)
+        if batch is not None:
+            if job[2] is None:
+                job[2] = batch
+            else:
+                for name, _ in MiningHistory.COLUMNS:
+                    job[2][name].extend(batch[name])
+                job[2]["names"] = batch["names"]
+        return job
+
+    def submit(self, snapshot, ops, batch=None, changes=None):
+        with self.cond:
+            if self.failed is not None:
+                self.pending, self.failed = self.failed, None
+            self.pending = self.merge(self.pending, snapshot, ops, batch, changes or SaveChanges())
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                job, self.pending = self.pending, None
+                self.busy = True
+            snapshot, ops, batch, changes = job
+            start = time.perf_counter()
+            try:
+                merged = self.commit(snapshot, ops, changes, batch)
+                if merged is not None:
+                    with self.cond:
+                        self.merged = merged
+            except BaseException as error:
+                # Not only OSError: a field the format can't hold must not end the thread either
+                with self.cond:
+                    self.errors.append(f"Failed to save game data: {error or type(error).__name__}")
+                    self.failed = job
+                if not isinstance(error, Exception):
+                    raise  # Interpreter shutdown and the like; wait() notices the thread is gone
+            finally:
+                if PROFILER.enabled:
+                    PROFILER.observe("save.io", time.perf_counter() - start)
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def idle(self):
+        with self.cond:
+            return self.pending is None and not self.busy
+
+    def take_merged(self):
+        with self.cond:
+            merged, self.merged = self.merged, None
+        return merged
+
+    def wait(self):
+        """Block until everything submitted so far has been written or has failed."""
+        with self.cond:
+            if self.failed is not None and self.pending is None:
+                # Give a failed save one more try before giving up
+                self.pending, self.failed = self.failed, None
+                self.cond.notify_all()
+            while self.pending is not None or self.busy:
+                if not self.thread.is_alive():
+                    self.errors.append("Failed to save game data: the saver thread stopped")
+                    self.failed, self.pending = self.failed or self.pending, None
+                    self.busy = False
+                    break
+                self.cond.wait(0.5)  # Timed, so a saver that died mid-job can't block us forever
+
+LEADERBOARD_PATH = os.path.join(os.path.expanduser("~"), ".drilling_leaderboard.db")
+
+class Leaderboard:
+    # Every profile played from the command line, one row each, updated on every save. The
+    # per-metric indexes make an update and a top-k B-tree operations instead of a scan of every
+    # save; a rank lookup still counts the rows ahead of the profile, O(log n + rank)
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS board (
+            source TEXT NOT NULL, profile TEXT NOT NULL, name TEXT,
+            coins INTEGER, drills_used INTEGER, luck INTEGER, value INTEGER,
+            PRIMARY KEY (source, profile)
+        );
+        CREATE INDEX IF NOT EXISTS board_coins ON board (coins);
+        CREATE INDEX IF NOT EXISTS board_drills_used ON board (drills_used);
+        CREATE INDEX IF NOT EXISTS board_luck ON board (luck);
+        CREATE INDEX IF NOT EXISTS board_value ON board (value);
+    """
+    METRICS = {"coins": "Coins", "drills_used": "Mines", "luck": "Luck", "value": "Inventory value"}
+    # A save whose inventory wasn't read (lazy binary sections) keeps the value it had
+    UPSERT = ("INSERT INTO board (source, profile, name, coins, drills_used, luck, value) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (source, profile) DO UPDATE SET "
+              "name = excluded.name, coins = excluded.coins, drills_used = excluded.drills_used, "
+              "luck = excluded.luck, value = COALESCE(excluded.value, value)")
+    TOP = {metric: f"SELECT source, profile, name, {metric} FROM board WHERE {metric} IS NOT NULL "
+                   f"ORDER BY {metric} DESC, source, profile LIMIT ?" for metric in METRICS}
+    SCORE = {metric: f"SELECT {metric} FROM board WHERE source = ? AND profile = ?" for metric in METRICS}
+    AHEAD = {metric: f"SELECT COUNT(*) FROM board WHERE {metric} > ?" for metric in METRICS}
+
+    def __init__(self, db_path, prices):
+        self.db_path = db_path
+        self.conn = sqlite_connection(db_path, self.SCHEMA)
+        self.prices = prices  # Ore name -> base price, for the inventory value
+
+    def value(self, inventory):
+        # Over the priced ores, so leftover names in old saves cost nothing
+        return sum(price * inventory.get(name, 0) for name, price in self.prices.items())
+
+    def row(self, key, data):
+        inventory = data.get("inventory")
+        value = self.value(inventory) if isinstance(inventory, dict) else None
+        return (*key, data.get("name"), data.get("coins", 0), data.get("drills_used", 0), data.get("luck", 0), value)
+
+    def write(self, row):
+        self.conn.execute(self.UPSERT, row)
+
+    def remove(self, key):
+        self.conn.execute("DELETE FROM board WHERE source = ? AND profile = ?", key)
+
+    def top(self, metric, count=10):
+        """Return the best `count` rows as (source, profile, name, score)."""
+        return self.conn.execute(self.TOP[metric], (count,)).fetchall()
+
+    def rank(self, metric, key):
+        """1-based place by `metric`, None when the profile isn't on the board or has no score."""
+        score = self.conn.execute(self.SCORE[metric], key).fetchone()
+        if score is None or score[0] is None:
+            return None
+        return 1 + self.conn.execute(self.AHEAD[metric], score).fetchone()[0]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM board").fetchone()[0]
+
+    def rebuild(self, paths=(), dbs=()):
+        """Rebuild the board from the saves already on it plus `paths` and every profile in `dbs`."""
+        sources = {os.path.abspath(path) for path in paths}
+        databases = {os.path.abspath(db) for db in dbs}
+        for source, profile in self.conn.execute("SELECT source, profile FROM board").fetchall():
+            (databases if profile else sources).add(source)
+        rows = []
+        for path in sorted(sources):
+            if os.path.exists(path):
+                rows.append(self.row((path, ""), UserDataManager(path).materialize()))
+        for db in sorted(databases):
+            if os.path.exists(db):
+                for profile, *_ in SqliteStorage.profiles(db):
+                    data = UserDataManager(None, storage=SqliteStorage(db, profile))
+                    rows.append(self.row((db, profile), data.materialize()))
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM board")
+            self.conn.executemany(self.UPSERT, rows)
+        return len(rows)
+
+    @staticmethod
+    def label(source, profile):
+        return profile or profile_name(source)
+
+def open_leaderboard(content, db_path=None):
+    """The shared leaderboard, at db_path, DRILLING_LEADERBOARD or ~/.drilling_leaderboard.db."""
+    return Leaderboard(db_path or os.environ.get("DRILLING_LEADERBOARD") or LEADERBOARD_PATH,
+                       {ore.name: ore.price for ore in content.ores})
+
+def migrate_unversioned(data, defaults):
+    # Saves from before versioning: fill in whatever keys that release didn't have yet
+    for key, value in defaults.items():
+        if key not in data:
+            data[key] = copy.deepcopy(value)
+    data["version"] = 2
+
+def empty_stats():
+    return {"digs": 0, "ores": {}, "events": {}, "by_luck": {}, "coins": 0, "seconds": 0.0, "dry": {}}
+
+def add_mining_stats(data, defaults):
+    # Version 3 keeps running mining aggregates; older digs are only known through drills_used
+    data.setdefault("stats", empty_stats())
+    data["version"] = 3
+
+def add_market(data, defaults):
+    # Version 4 remembers recent sales per ore for market prices
+    data.setdefault("market", {})
+    data["version"] = 4
+
+# SAVE_MIGRATIONS[n - 1] upgrades a version n save to version n + 1
+SAVE_MIGRATIONS = (migrate_unversioned, add_mining_stats, add_market)
+SAVE_VERSION = len(SAVE_MIGRATIONS) + 1
+
 class UserDataManager:
-    def __init__(self, file_path='user_data.json'):
+    def __init__(self, file_path='user_data.json', journal=False, compact_threshold=64 * 1024, storage=None,
+                 save_format=None, background=False, leaderboard=None):
         self.file_path = file_path
+        detected = detect_save_format(file_path) if file_path and storage is None else None
+        if storage is None:
+            storage = self.open_storage(detected or save_format, journal, compact_threshold)
+        self.storage = storage
+        self.history = MiningHistory(storage.history_dir) if storage.history_dir else None
         self.default_data = {
+            "version": SAVE_VERSION,
             "name": "Miner",
             "coins": 0,
             "luck": 0,
@@ -25,114 +1147,1509 @@ class UserDataManager:
             "drill": "Beginner Drill",
             "inventory": {},
             "drills_used": 0,
+            "instant_mining": False,
+            "auto_drill": False,
+            "stats": empty_stats(),
+            "market": {},
             "last_played": datetime.datetime.now().isoformat()
         }
+        self.dirty = False
+        self._batch_depth = 0
+        self._pending = []
+        self._lazy = False  # Whether the save still has sections that haven't been read
+        self._copies = {}  # Key -> (container, its copy) from the last snapshot
+        self._touched = set()  # Keys changed since that snapshot
+        self.errors = []
+        self.saver = None
+        self._seen = None  # Save generation as of our last load or save
+        # Unsaved changes as deltas, for merging with saves other processes make meanwhile
+        self._changes = SaveChanges() if self.storage.save_lock else None
         self.data = self.load()
+        if detected and save_format and save_format != detected:
+            # Rewrite an existing save in the requested format
+            self.convert(self.open_storage(save_format, journal, compact_threshold))
+        # Only saves given a Leaderboard are ranked, the game opts in from main()
+        self.board = leaderboard if self.storage.board_key else None
+        self._board_row = None  # Last row written to the board, unchanged rows are skipped
+        self._board_failing = False  # A failing board is reported once, not on every save
+        self.saver = BackgroundSaver(self.commit, self.history) if background else None
+
+    def open_storage(self, save_format, journal=False, compact_threshold=64 * 1024):
+        if not self.file_path:
+            return Storage()
+        if save_format == "binary":
+            return BinaryStorage(self.file_path)
+        return JsonStorage(self.file_path, journal, compact_threshold)
 
+    def fresh_data(self):
+        return copy.deepcopy(self.default_data)
+
+    @PROFILER.timed("save.load")
     def load(self):
-        if not os.path.exists(self.file_path):
-            return self.default_data.copy()
-        try:
-            with open(self.file_path, 'r') as file:
-                data = json.load(file)
-                # Add missing keys
-                for key, value in self.default_data.items():
-                    if key not in data:
-                        data[key] = value
-                return data
-        except:
-            return self.default_data.copy()
+        with self.locked():
+            self._seen = self.generation()
+            data = self.storage.load()
+        if data is None:
+            return self.fresh_data()
+        self._lazy = any(type(value) is LazySection for value in data.values())
+        return self.upgrade(data)
+
+    def upgrade(self, data):
+        # Run the migration chain from the save's version up to SAVE_VERSION
+        version = data.get("version", 1)
+        if version > SAVE_VERSION:
+            print(f"{Color.YELLOW}Save is from a newer version ({version}), some data may be ignored{Color.END}")
+        for migrate in SAVE_MIGRATIONS[version - 1:]:
+            migrate(data, self.default_data)
+        return data
+
+    def materialize(self):
+        # Read every lazily loaded section, for code that needs the whole save at once
+        for key, value in self.data.items():
+            if isinstance(value, LazySection):
+                self.data[key] = value.load()
+        return self.data
+
+    def convert(self, storage):
+        old = self.storage
+        self.storage = storage
+        self._changes = SaveChanges() if storage.save_lock else None
+        self.materialize()
+        self.compact()
+        if isinstance(old, JsonStorage):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old.journal_path)
 
+    @PROFILER.timed("save.write")
     def save(self):
-        self.data["last_played"] = datetime.datetime.now().isoformat()
+        PROFILER.count("save.writes")
+        self.record("set", "last_played", datetime.datetime.now().isoformat())
+        if self.saver:
+            batch = self.history.take() if self.history is not None else None
+            self.saver.submit(self.snapshot(), self._pending, batch, self._changes)
+            self._pending = []
+            self._changes = SaveChanges() if self._changes is not None else None
+            self.dirty = False
+            return
+        batch = self.history.take() if self.history is not None else None
+        try:
+            merged = self.commit(self.data, self._pending, self._changes, batch)
+            if merged is not None:
+                self.adopt(merged)
+            self._pending = []
+            self._changes = SaveChanges() if self._changes is not None else None
+            self.dirty = False
+        except (OSError, sqlite3.Error) as error:
+            if batch is not None:
+                self.history.restore(batch)
+            self.errors.append(f"Failed to save game data: {error}")
+
+    def commit(self, data, ops, changes=None, batch=None):
+        """Write a save under the file lock, returning the merged save if another process wrote first."""
+        storage = self.storage
+        merged = None
+        with self.locked():
+            if batch is not None:
+                self.history.write(batch)
+            # Still behind a merge the main thread hasn't picked up: this snapshot lacks it too
+            behind = self.saver is not None and self.saver.merged is not None
+            if behind or self.generation() != self._seen:
+                theirs = storage.load()
+                if theirs is not None:
+                    PROFILER.count("save.merges")
+                    data = merged = (changes or SaveChanges()).apply(self.upgrade(theirs), data)
+            # Bumped before writing, so a crash in between only costs the others a needless reload
+            self._seen = storage.save_lock.bump() if storage.save_lock else None
+            if merged is not None:
+                storage.write(data)
+            else:
+                storage.commit(data, ops)
+        if self.board is not None:
+            row = self.board.row(self.storage.board_key, data)
+            if row != self._board_row:
+                # A missed update only leaves the board stale until `leaderboard --rebuild`
+                try:
+                    self.board.write(row)
+                    self._board_row = row
+                    self._board_failing = False
+                except sqlite3.Error as error:
+                    if not self._board_failing:
+                        self.report(f"Failed to update the leaderboard: {error}")
+                    self._board_failing = True
+        return merged
+
+    def report(self, error):
+        # commit() runs on the saver thread when there is one, so its errors go through the saver
+        if self.saver:
+            with self.saver.cond:
+                self.saver.errors.append(error)
+        else:
+            self.errors.append(error)
+
+    def adopt(self, data):
+        self.data = data
+        self._lazy = any(type(value) is LazySection for value in data.values())
+
+    def sync(self):
+        """Pick up saves made by other processes; costs a memory read when there are none."""
+        if self.saver:
+            if not self.saver.idle():
+                return  # That save merges with the file when it's written
+            merged = self.saver.take_merged()
+            if merged is not None:
+                self.adopt(self._changes.apply(merged, self.data))
+        if self.generation() == self._seen:
+            return
+        with self.locked():
+            self._seen = self.generation()
+            theirs = self.storage.load()
+        if theirs is not None:
+            self.adopt(self._changes.apply(self.upgrade(theirs), self.data))
+
+    def locked(self):
+        lock = self.storage.save_lock
+        return lock.hold() if lock else contextlib.nullcontext()
+
+    def generation(self):
+        # Counter in the mapped lock file: a memory read, no syscall
+        lock = self.storage.save_lock
+        return lock.generation() if lock else None
+
+    def snapshot(self):
+        # Copy the containers so the saver thread never sees later changes. The saver only
+        # reads them, so a container unchanged since the last snapshot reuses that copy
+        copies = {}
+        for key, value in self.data.items():
+            if isinstance(value, (dict, list)):
+                cached = self._copies.get(key)
+                if cached is None or cached[0] is not value or key in self._touched:
+                    cached = (value, copy.deepcopy(value))
+                copies[key] = cached
+        self._copies = copies
+        self._touched = set()
+        return {key: copies[key][1] if key in copies else value for key, value in self.data.items()}
+
+    def take_errors(self):
+        """Return and clear the save failures not shown to the player yet."""
+        errors = self.errors
+        self.errors = []
+        if self.saver:
+            with self.saver.cond:
+                errors += self.saver.errors
+                self.saver.errors = []
+        return errors
+
+    def compact(self):
+        with self.locked():
+            if self.storage.save_lock:
+                self._seen = self.storage.save_lock.bump()
+            self.storage.write(self.data)
+        self._pending = []
+
+    def record(self, kind, key, value):
+        if self._lazy and not (kind == "set" and isinstance(key, str)):
+            self.get(op_root(kind, key))
+        apply_op(self.data, (kind, key, value))
+        self._touched.add(op_root(kind, key))
+        if self._changes is not None:
+            self._changes.note(kind, key, value)
+        if self.storage.wants_ops:
+            # Copy containers so later in-place changes can't leak into the record
+            if isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)
+            self._pending.append((kind, key, value))
+
+    def mark_dirty(self):
+        self.dirty = True
+        if not self._batch_depth:
+            self.save()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Batch changes and write them once when the outermost block exits
+        self._batch_depth += 1
         try:
-            with open(self.file_path, 'w') as file:
-                json.dump(self.data, file)
-        except:
-            print(f"{Color.RED}Failed to save game data{Color.END}")
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self.dirty:
+                self.save()
+
+    def flush(self):
+        """Save pending changes and wait until they are on disk."""
+        if self.dirty:
+            self.save()
+        if self.saver:
+            self.saver.wait()
 
     def get(self, key, default=None):
-        return self.data.get(key, default)
+        value = self.data.get(key, default)
+        if type(value) is LazySection:
+            value = self.data[key] = value.load()
+        return value
 
     def set(self, key, value):
-        self.data[key] = value
-        self.save()
+        self.record("set", key, value)
+        self.mark_dirty()
 
     def add(self, key, amount=1):
-        self.data[key] = self.get(key, 0) + amount
-        self.save()
+        self.record("add", key, amount)
+        self.mark_dirty()
 
     def update_inventory(self, ore, quantity):
-        inventory = self.get("inventory", {})
-        inventory[ore] = inventory.get(ore, 0) + quantity
-        if inventory[ore] <= 0:
-            inventory.pop(ore)
-        self.data["inventory"] = inventory
-        self.save()
+        self.record("inv", ore, quantity)
+        self.mark_dirty()
+
+    def add_decaying(self, key, amount, when, rate):
+        """Add to a decaying [amount, when] total, see fold_decaying()."""
+        self.record("decay", key, [amount, when, rate])
+        self.mark_dirty()
 
     def reset(self):
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
-        self.data = self.default_data.copy()
+        if self.saver:
+            self.saver.wait()
+            # A merge waiting to be adopted holds the old progress, sync() must not bring it back
+            self.saver.take_merged()
+        with self.locked():
+            if self.storage.save_lock:
+                self._seen = self.storage.save_lock.bump()
+            self.storage.delete()
+            if self.history is not None:
+                self.history.delete()
+        if self.board is not None:
+            try:
+                self.board.remove(self.storage.board_key)
+            except sqlite3.Error as error:
+                self.errors.append(f"Failed to update the leaderboard: {error}")
+            self._board_row = None
+        self._pending = []
+        self._changes = SaveChanges() if self._changes is not None else None
+        self.data = self.fresh_data()
         self.save()
+        self.flush()
 
-class MiningGame:
-    def __init__(self):
-        self.data = UserDataManager()
-        self.ores = self.define_ores()
-        self.drill_speeds = {
-            "Beginner Drill": 0.5,
-            "Novice Drill": 0.4,
-            "Advanced Drill": 0.2,
-            "Expert Drill": 0.1,
-            "Master Drill": 0.05
-        }
-        self.drill_costs = {
-            "Beginner Drill": 0,
-            "Novice Drill": 100, 
-            "Advanced Drill": 300,
-            "Expert Drill": 600,
-            "Master Drill": 1200
-        }
-        self.luck_cost = lambda level: (level + 1) * 50
-        self.energy_cost = lambda level: level * 100
-        self.check_energy_regen()
-
-    def define_ores(self):
-        return [
-            {"name": "Coal", "price": 1, "min_luck": 0, "max_luck": 20, "color": "", "weight": 10},
-            {"name": "Iron", "price": 3, "min_luck": 0, "max_luck": 20, "color": Color.BOLD, "weight": 8},
-            {"name": "Copper", "price": 5, "min_luck": 2, "max_luck": 20, "color": Color.YELLOW, "weight": 6},
-            {"name": "Silver", "price": 10, "min_luck": 4, "max_luck": 20, "color": Color.BOLD, "weight": 4},
-            {"name": "Gold", "price": 25, "min_luck": 6, "max_luck": 20, "color": Color.YELLOW + Color.BOLD, "weight": 3},
-            {"name": "Diamond", "price": 60, "min_luck": 8, "max_luck": 20, "color": Color.BLUE + Color.BOLD, "weight": 2},
-            {"name": "Ruby", "price": 150, "min_luck": 10, "max_luck": 20, "color": Color.RED + Color.BOLD, "weight": 1.5},
-            {"name": "Emerald", "price": 350, "min_luck": 12, "max_luck": 20, "color": Color.GREEN + Color.BOLD, "weight": 1},
-            {"name": "Obsidian", "price": 800, "min_luck": 14, "max_luck": 20, "color": Color.PURPLE + Color.BOLD, "weight": 0.7},
-            {"name": "Mythril", "price": 1800, "min_luck": 16, "max_luck": 20, "color": Color.BLUE, "weight": 0.4},
-            {"name": "Voidcore", "price": 4000, "min_luck": 18, "max_luck": 20, "color": Color.PURPLE, "weight": 0.2}
-        ]
-
-    def check_energy_regen(self):
+class Ore(NamedTuple):
+    id: int
+    name: str
+    price: int
+    min_luck: int
+    max_luck: int
+    color: str
+    weight: float
+
+class OreRegistry:
+    # Immutable ore records indexed by name and by unlock level
+    def __init__(self, ores):
+        ordered = sorted(ores, key=lambda ore: ore["min_luck"])
+        self.records = tuple(Ore(i, ore["name"], ore["price"], ore["min_luck"], ore.get("max_luck", 20),
+                                 ore.get("color", ""), ore["weight"]) for i, ore in enumerate(ordered))
+        self.by_name = {ore.name: ore for ore in self.records}
+        self._min_lucks = [ore.min_luck for ore in self.records]
+        self.max_level = self._min_lucks[-1] if self.records else 0
+        # Records are sorted by min_luck, so each unlocked set is a prefix slice
+        self._unlocked = [self.records[:bisect.bisect_right(self._min_lucks, level)]
+                          for level in range(self.max_level + 1)]
+        self._unlocked_at = {}
+        for ore in self.records:
+            self._unlocked_at[ore.min_luck] = self._unlocked_at.get(ore.min_luck, ()) + (ore,)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def unlocked(self, luck):
+        if luck < 0:
+            return ()
+        return self._unlocked[min(luck, self.max_level)]
+
+    def unlocked_at(self, level):
+        return self._unlocked_at.get(level, ())
+
+    def next_locked(self, luck):
+        unlocked = len(self.unlocked(luck))
+        return self.records[unlocked] if unlocked < len(self.records) else None
+
+class OreSampler:
+    # Walker/Vose alias tables per luck level, so picking an ore is O(1)
+
+    def __init__(self, ores, max_luck=None):
+        # Past the last unlock level every table is the same
+        self.max_luck = ores.max_level if max_luck is None else max_luck
+        self.set_ores(ores)
+
+    def set_ores(self, ores):
+        self.ores = ores
+        self.invalidate()
+
+    def invalidate(self):
+        self._tables = {}
+
+    def preload(self, tables):
+        # Tables compiled ahead of time for these ores, keyed by luck
+        self._tables.update(tables)
+
+    def table(self, luck):
+        luck = max(0, min(luck, self.max_luck))
+        table = self._tables.get(luck)
+        if table is None:
+            table = self._tables[luck] = self.build_table(self.ores.unlocked(luck))
+        return table
+
+    @staticmethod
+    def build_table(ores):
+        n = len(ores)
+        if not n:
+            return (), [], []
+        total = sum(ore.weight for ore in ores)
+        scaled = [ore.weight * n / total for ore in ores]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Leftovers are 1.0 up to rounding error
+        return tuple(ores), prob, alias
+
+    def choose(self, luck, rng=random):
+        ores, prob, alias = self.table(luck)
+        u = rng.random() * len(ores)
+        i = int(u)
+        return ores[i] if u - i < prob[i] else ores[alias[i]]
+
+    def sample(self, luck, n, rng=random):
+        ores, prob, alias = self.table(luck)
+        size = len(ores)
+        picks = []
+        for _ in range(n):
+            u = rng.random() * size
+            i = int(u)
+            picks.append(ores[i] if u - i < prob[i] else ores[alias[i]])
+        return picks
+
+def binomial(rng, n, p):
+    # Port of random.binomialvariate (Python 3.12+) for older interpreters
+    if n <= 0 or p <= 0.0:
+        return 0
+    if p >= 1.0:
+        return n
+    if hasattr(rng, "binomialvariate"):
+        return rng.binomialvariate(n, p)
+    if p > 0.5:
+        return n - binomial(rng, n, 1.0 - p)
+    random_ = rng.random
+    if n * p < 10.0:
+        # Geometric method, O(np)
+        x = y = 0
+        c = math.log(1.0 - p)
+        if not c:
+            return x
+        while True:
+            y += math.floor(math.log(1.0 - random_()) / c) + 1
+            if y > n:
+                return x
+            x += 1
+    # BTRS transformed rejection (Hormann 1993)
+    spq = math.sqrt(n * p * (1.0 - p))
+    b = 1.15 + 2.53 * spq
+    a = -0.0873 + 0.0248 * b + 0.01 * p
+    c = n * p + 0.5
+    vr = 0.92 - 4.2 / b
+    setup_complete = False
+    while True:
+        u = random_() - 0.5
+        us = 0.5 - abs(u)
+        k = math.floor((2.0 * a / us + b) * u + c)
+        if k < 0 or k > n:
+            continue
+        v = random_()
+        if us >= 0.07 and v <= vr:
+            return k
+        if not setup_complete:
+            alpha = (2.83 + 5.1 / b) * spq
+            lpq = math.log(p / (1.0 - p))
+            m = math.floor((n + 1) * p)
+            h = math.lgamma(m + 1) + math.lgamma(n - m + 1)
+            setup_complete = True
+        v *= alpha / (a / (us * us) + b)
+        if v > 0 and math.log(v) <= h - math.lgamma(k + 1) - math.lgamma(n - k + 1) + (k - m) * lpq:
+            return k
+
+def multinomial(rng, n, weights):
+    # Sequential conditional binomials, O(len(weights)) regardless of n
+    counts = []
+    remaining_weight = float(sum(weights))
+    for weight in weights:
+        if n <= 0 or remaining_weight <= 0:
+            counts.append(0)
+            continue
+        k = binomial(rng, n, min(1.0, weight / remaining_weight))
+        counts.append(k)
+        n -= k
+        remaining_weight -= weight
+    return counts
+
+def uniform_int_sum(rng, k, low, high):
+    # Sum of k independent randint(low, high) draws
+    if k <= 256:
+        return sum(rng.randint(low, high) for _ in range(k))
+    # Normal approximation, indistinguishable at this size
+    span = high - low + 1
+    mean = k * (low + high) / 2
+    sd = math.sqrt(k * (span * span - 1) / 12)
+    return max(k * low, min(k * high, round(rng.gauss(mean, sd))))
+
+@dataclass
+class MiningDelta:
+    ore_counts: dict = field(default_factory=dict)
+    coins: int = 0
+    energy: int = 0
+    drills_used: int = 0
+    events: dict = field(default_factory=dict)
+
+class BulkMiner:
+    # Resolves many digs at once with the same odds as digging one by one
+    ENERGY_PER_DIG = 5
+    EVENT_TYPES = ("bonus", "energy", "double", "empty")
+
+    def __init__(self, sampler, use_numpy=True, events=None):
+        self.sampler = sampler
+        self.use_numpy = use_numpy and np is not None
+        if events is None:
+            events = load_content().events
+        self.event_types = tuple(events["weights"])
+        self.event_weights = [events["weights"][event] for event in self.event_types]
+        self.event_chance = events["chance"] if self.event_types else 0.0
+        # Each type repeated by its weight, so rng.choice() picks with the table's odds
+        self.event_pool = tuple(event for event, weight in zip(self.event_types, self.event_weights)
+                                for _ in range(weight))
+        self.bonus_coins = tuple(events["coins"])
+        self.crystal_energy = tuple(events["energy"])
+
+    def event_rate(self, event):
+        """Chance that a single dig triggers `event`."""
+        if event not in self.event_types:
+            return 0.0
+        return self.event_chance * self.event_pool.count(event) / len(self.event_pool)
+
+    def resolve(self, luck, energy, count=None, rng=random):
+        """Dig `count` times, or until out of energy when count is None."""
+        ores, _, _ = self.sampler.table(luck)
+        delta = MiningDelta(events=dict.fromkeys(self.EVENT_TYPES, 0))
+        if not ores:
+            return delta
+        weights = [ore.weight for ore in ores]
+        ore_counts = [0] * len(ores)
+        np_rng = np.random.default_rng(rng.getrandbits(64)) if self.use_numpy else None
+        while True:
+            digs = energy // self.ENERGY_PER_DIG
+            if count is not None:
+                digs = min(count - delta.drills_used, digs)
+            if digs <= 0:
+                break
+            found, events, coins, crystal = self.roll(rng, np_rng, digs, weights)
+            for i, n in enumerate(found):
+                ore_counts[i] += n
+            for name, n in zip(self.event_types, events):
+                delta.events[name] += n
+            delta.coins += coins
+            delta.drills_used += digs
+            energy += crystal - digs * self.ENERGY_PER_DIG
+            delta.energy += crystal - digs * self.ENERGY_PER_DIG
+            if count is not None:
+                break  # A fixed count is capped up front, crystals don't extend it
+        delta.ore_counts = {ore.name: n for ore, n in zip(ores, ore_counts) if n}
+        return delta
+
+    def roll(self, rng, np_rng, digs, weights):
+        types = self.event_types
+        if np_rng is not None:
+            p = np.asarray(weights, dtype=float)
+            p /= p.sum()
+            found = np_rng.multinomial(digs, p)
+            events = np_rng.multinomial(np_rng.binomial(digs, self.event_chance),
+                                        np.asarray(self.event_weights, dtype=float) / sum(self.event_weights)
+                                        ) if types else np.zeros(0, dtype=int)
+            counts = dict(zip(types, events.tolist()))
+            found = found + np_rng.multinomial(counts.get("double", 0), p)
+            coins = int(np_rng.integers(self.bonus_coins[0], self.bonus_coins[1] + 1, counts.get("bonus", 0)).sum())
+            crystal = int(np_rng.integers(self.crystal_energy[0], self.crystal_energy[1] + 1,
+                                          counts.get("energy", 0)).sum())
+            return found.tolist(), events.tolist(), coins, crystal
+        found = multinomial(rng, digs, weights)
+        events = multinomial(rng, binomial(rng, digs, self.event_chance), self.event_weights) if types else []
+        counts = dict(zip(types, events))
+        # Double deposits add a second copy of that dig's ore
+        for i, n in enumerate(multinomial(rng, counts.get("double", 0), weights)):
+            found[i] += n
+        coins = uniform_int_sum(rng, counts.get("bonus", 0), *self.bonus_coins)
+        crystal = uniform_int_sum(rng, counts.get("energy", 0), *self.crystal_energy)
+        return found, events, coins, crystal
+
+@dataclass
+class DigResult:
+    ore: dict
+    event: str = None
+    amount: int = 0
+
+@dataclass
+class MiningResult:
+    ok: bool
+    reason: str = ""
+    digs: list = field(default_factory=list)
+    ore_counts: dict = field(default_factory=dict)
+    coins: int = 0
+    energy: int = 0
+    capped: bool = False
+
+@dataclass
+class ActionResult:
+    ok: bool
+    reason: str = ""
+    coins: int = 0
+    amount: int = 0
+    value: object = None
+    sold: dict = field(default_factory=dict)
+    unlocked: list = field(default_factory=list)
+
+class MiningStats:
+    # Running aggregates kept in the save and updated per batch, so reading them never scans
+    # history. Each update is a small add or set on one nested field of "stats", which keeps a
+    # journal record O(1) and lets saves from several processes merge field by field
+    def __init__(self, data, ores):
+        self.data = data
+        self.ores = ores
+
+    def tally(self, luck, ore_counts, digs, events, seconds, coins):
+        add = self.data.add
+        level = ["stats", "by_luck", str(luck)]
+        add(["stats", "digs"], digs)
+        add(["stats", "seconds"], seconds)
+        if coins:
+            add(["stats", "coins"], coins)
+        add(level + ["digs"], digs)
+        for name, count in ore_counts.items():
+            if count:
+                add(["stats", "ores", name], count)
+                add(level + ["ores", name], count)
+        for event, count in events.items():
+            if count:
+                add(["stats", "events", event], count)
+
+    def dry(self, stats, luck):
+        # Dry streaks count from the first dig an ore could have been found
+        dry = stats["dry"]
+        for ore in self.ores.unlocked(luck):
+            if ore.name not in dry:
+                # Dig index after the last find, longest gap
+                self.data.set(["stats", "dry", ore.name], [stats["digs"], 0])
+        return dry
+
+    def record_digs(self, luck, digs, seconds, coins=0):
+        """Fold a batch of DigResults into the aggregates."""
+        names = [dig.ore.name for dig in digs]
+        stats = self.data.get("stats")
+        with self.data.transaction():
+            dry = self.dry(stats, luck)
+            entries = {}
+            for i, name in enumerate(names, stats["digs"]):
+                entry = entries.get(name)
+                if entry is None:
+                    entry = entries[name] = list(dry[name])
+                if i - entry[0] > entry[1]:
+                    entry[1] = i - entry[0]
+                entry[0] = i + 1
+            for name, entry in entries.items():
+                self.data.set(["stats", "dry", name], entry)
+            self.tally(luck, Counter(names), len(digs), Counter(dig.event for dig in digs if dig.event),
+                       seconds, coins)
+
+    def record_bulk(self, luck, delta, seconds):
+        """Fold a bulk-resolved MiningDelta in; without dig order, a find ends its ore's streak
+        at the start of the batch, the longest stretch known to be dry."""
+        stats = self.data.get("stats")
+        with self.data.transaction():
+            dry = self.dry(stats, luck)
+            start = stats["digs"]
+            for name in delta.ore_counts:
+                if name in dry:
+                    last, longest = dry[name]
+                    self.data.set(["stats", "dry", name], [start + delta.drills_used, max(longest, start - last)])
+            self.tally(luck, delta.ore_counts, delta.drills_used, delta.events, seconds, delta.coins)
+
+    def record_coins(self, coins):
+        self.data.add(["stats", "coins"], coins)
+
+    def rates(self, luck):
+        """Rows of (ore, found, observed share, expected share) for digs made at `luck`."""
+        found = self.data.get("stats")["by_luck"].get(str(luck), {}).get("ores", {})
+        ores = self.ores.unlocked(luck)
+        total_weight = sum(ore.weight for ore in ores)
+        draws = sum(found.values())
+        return [(ore, found.get(ore.name, 0), found.get(ore.name, 0) / draws if draws else 0.0,
+                 ore.weight / total_weight)
+                for ore in ores]
+
+    def coins_per_hour(self):
+        stats = self.data.get("stats")
+        return stats["coins"] / stats["seconds"] * 3600 if stats["seconds"] else 0.0
+
+    def dry_streaks(self, luck, limit=3):
+        """(ore, current streak, longest streak) for the rarest ores unlocked at `luck`."""
+        stats = self.data.get("stats")
+        rarest = sorted(self.ores.unlocked(luck), key=lambda ore: ore.weight)[:limit]
+        return [(ore, stats["digs"] - stats["dry"][ore.name][0],
+                 max(stats["dry"][ore.name][1], stats["digs"] - stats["dry"][ore.name][0]))
+                for ore in rarest if ore.name in stats["dry"]]
+
+class Market:
+    # Sell prices that sag with recent sales and recover over time. Each ore keeps a single
+    # exponentially decaying total of units sold, saved as [amount, when] and only brought up
+    # to date when read or sold, so a sale is one O(1) op and nothing has to tick in the background
+    def __init__(self, data, settings):
+        self.data = data
+        self.floor = settings["floor"]
+        self.decay = math.log(2) / settings["half_life"]
+        self.depth = settings["depth"]  # Units sold that cut the price above the floor by 1/e
+
+    def pressure(self, name, now):
+        entry = self.data.get("market").get(name)
+        if not entry:
+            return 0.0
+        amount, when = entry
+        return amount * math.exp(-self.decay * max(now - when, 0))
+
+    def sag(self, name, now):
+        depth = self.depth.get(name, math.inf)
+        return math.exp(-self.pressure(name, now) / depth) if depth != math.inf else 1.0
+
+    def price(self, ore, now):
+        """Current price of one unit of `ore`."""
+        return ore.price * (self.floor + (1 - self.floor) * self.sag(ore.name, now))
+
+    def quote(self, ore, count, now):
+        """Coins for selling `count` units at once, each unit priced after the sales before it."""
+        depth = self.depth.get(ore.name, math.inf)
+        if depth == math.inf:
+            return ore.price * count
+        # Unit i sells at floor + (1 - floor) * sag * r**i with r = e**(-1/depth): a geometric series
+        series = math.expm1(-count / depth) / math.expm1(-1 / depth)
+        return round(ore.price * (self.floor * count + (1 - self.floor) * self.sag(ore.name, now) * series))
+
+    def record(self, sold, now):
+        # Only the sold ores' entries change, the others keep decaying from where they are
+        with self.data.transaction():
+            for name, count in sold.items():
+                if name in self.depth:
+                    self.data.add_decaying(["market", name], count, now, self.decay)
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+CONTENT_FILES = ("ores", "drills", "events", "upgrades", "market")
+# Compiled tables live with the player's files, never in a (possibly shared) content folder
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "drilling_game")
+
+def check_curve(curve, where, problems):
+    if not isinstance(curve, dict) or not all(isinstance(curve.get(key), (int, float)) for key in ("base", "per_level")):
+        problems.append(f"{where}: needs numeric base and per_level")
+    elif not isinstance(curve.get("growth", 1.0), (int, float)) or curve.get("growth", 1.0) <= 0:
+        problems.append(f"{where}: growth must be a positive number")
+
+def check_range(value, where, problems):
+    if (not isinstance(value, list) or len(value) != 2 or not all(type(n) is int for n in value)
+            or value[0] > value[1]):
+        problems.append(f"{where}: must be [low, high] integers")
+
+def validate_content(tables):
+    """Return a list of problems with the raw content tables, empty when they are usable."""
+    problems = []
+    ores = tables["ores"]
+    if not isinstance(ores, list) or not ores:
+        return ["ores.json: must be a non-empty list"]
+    names = set()
+    for i, ore in enumerate(ores):
+        where = f"ores.json[{i}]"
+        if not isinstance(ore, dict) or not isinstance(ore.get("name"), str) or not ore["name"]:
+            problems.append(f"{where}: needs a name")
+            continue
+        where = f"ores.json {ore['name']!r}"
+        if ore["name"] in names:
+            problems.append(f"{where}: duplicate name")
+        names.add(ore["name"])
+        if type(ore.get("price")) is not int or ore["price"] < 0:
+            problems.append(f"{where}: price must be a non-negative integer")
+        if type(ore.get("min_luck")) is not int or ore["min_luck"] < 0:
+            problems.append(f"{where}: min_luck must be a non-negative integer")
+        if type(ore.get("max_luck", 0)) is not int:
+            problems.append(f"{where}: max_luck must be an integer")
+        if not isinstance(ore.get("weight"), (int, float)) or ore["weight"] <= 0:
+            problems.append(f"{where}: weight must be positive")
+        if not isinstance(ore.get("market_depth", 1), (int, float)) or ore.get("market_depth", 1) <= 0:
+            problems.append(f"{where}: market_depth must be a positive number of units")
+        if not isinstance(ore.get("color", []), list) or not all(
+                isinstance(code, str) and code.isupper() and hasattr(Color, code) for code in ore.get("color", [])):
+            problems.append(f"{where}: color must be a list of {', '.join(k for k in vars(Color) if k.isupper())}")
+    if not any(ore.get("min_luck") == 0 for ore in ores if isinstance(ore, dict)):
+        problems.append("ores.json: at least one ore must have min_luck 0")
+    
+    drills = tables["drills"]
+    if not isinstance(drills, list) or not drills:
+        problems.append("drills.json: must be a non-empty list")
+        drills = []
+    elif not isinstance(drills[0], dict) or drills[0].get("cost") != 0:
+        problems.append("drills.json[0]: the starting drill must cost 0")
+    seen = set()
+    for i, drill in enumerate(drills):
+        where = f"drills.json[{i}]"
+        if not isinstance(drill, dict) or not isinstance(drill.get("name"), str) or drill["name"] in seen:
+            problems.append(f"{where}: needs a unique name")
+            continue
+        seen.add(drill["name"])
+        if not isinstance(drill.get("speed"), (int, float)) or drill["speed"] <= 0:
+            problems.append(f"{where}: speed must be positive seconds per dig")
+        if type(drill.get("cost")) is not int or drill["cost"] < 0:
+            problems.append(f"{where}: cost must be a non-negative integer")
+    
+    events = tables["events"]
+    if not isinstance(events, dict) or not isinstance(events.get("chance"), (int, float)) or not 0 <= events["chance"] <= 1:
+        problems.append("events.json: chance must be between 0 and 1")
+    types = set()
+    for i, event in enumerate(events.get("events", []) if isinstance(events, dict) else []):
+        where = f"events.json[{i}]"
+        if not isinstance(event, dict) or event.get("type") not in BulkMiner.EVENT_TYPES or event["type"] in types:
+            problems.append(f"{where}: type must be one of {', '.join(BulkMiner.EVENT_TYPES)}, each used once")
+            continue
+        types.add(event["type"])
+        if type(event.get("weight")) is not int or event["weight"] < 1:
+            problems.append(f"{where}: weight must be a positive integer")
+        if event["type"] == "bonus":
+            check_range(event.get("coins"), f"{where} coins", problems)
+        if event["type"] == "energy":
+            check_range(event.get("energy"), f"{where} energy", problems)
+    
+    upgrades = tables["upgrades"]
+    luck = upgrades.get("luck") if isinstance(upgrades, dict) else None
+    energy = upgrades.get("energy") if isinstance(upgrades, dict) else None
+    if not isinstance(luck, dict) or type(luck.get("max")) is not int or not 0 <= luck["max"] <= MiningHistory.MAX_LUCK:
+        problems.append(f"upgrades.json: luck.max must be an integer from 0 to {MiningHistory.MAX_LUCK}")
+    else:
+        check_curve(luck.get("cost"), "upgrades.json luck.cost", problems)
+    if (not isinstance(energy, dict) or type(energy.get("step")) is not int or energy["step"] <= 0
+            or not isinstance(energy.get("regen_minutes"), (int, float)) or energy["regen_minutes"] <= 0):
+        problems.append("upgrades.json: energy needs a positive integer step and positive regen_minutes")
+    else:
+        check_curve(energy.get("cost"), "upgrades.json energy.cost", problems)
+    
+    market = tables["market"]
+    if not isinstance(market, dict) or not all(isinstance(market.get(key), (int, float)) and market[key] > 0
+                                               for key in ("half_life_minutes", "depth")):
+        problems.append("market.json: half_life_minutes and depth must be positive numbers")
+    if not isinstance(market, dict) or not isinstance(market.get("floor"), (int, float)) or not 0 <= market["floor"] <= 1:
+        problems.append("market.json: floor must be between 0 and 1")
+    return problems
+
+def compile_content(tables):
+    """Turn validated tables into the plain structures Content is built from."""
+    ores = sorted(({"name": ore["name"], "price": ore["price"], "min_luck": ore["min_luck"],
+                    "max_luck": ore.get("max_luck", tables["upgrades"]["luck"]["max"]),
+                    "color": "".join(getattr(Color, code) for code in ore.get("color", [])),
+                    "weight": ore["weight"]} for ore in tables["ores"]), key=lambda ore: ore["min_luck"])
+    registry = OreRegistry(ores)
+    max_luck = tables["upgrades"]["luck"]["max"]
+    # Alias tables for every luck level, stored as (prob, alias) lists over the unlocked prefix
+    sampling = {luck: OreSampler.build_table(registry.unlocked(luck))[1:] for luck in range(max_luck + 1)}
+    events = tables["events"]
+    return {
+        "ores": ores,
+        "sampling": sampling,
+        "drills": [(drill["name"], drill["speed"], drill["cost"]) for drill in tables["drills"]],
+        "events": {"chance": events["chance"],
+                   "weights": {event["type"]: event["weight"] for event in events.get("events", [])},
+                   "coins": tuple(next((e["coins"] for e in events.get("events", []) if e["type"] == "bonus"), (0, 0))),
+                   "energy": tuple(next((e["energy"] for e in events.get("events", []) if e["type"] == "energy"),
+                                        (0, 0)))},
+        "upgrades": tables["upgrades"],
+        # Depth is in coins of base value, so a dump of rare ores moves their price as much as
+        # the same worth of common ones
+        "market": {"half_life": tables["market"]["half_life_minutes"] * 60, "floor": tables["market"]["floor"],
+                   "depth": {ore["name"]: ore.get("market_depth", tables["market"]["depth"] / ore["price"]
+                                              if ore["price"] else math.inf) for ore in tables["ores"]}},
+    }
+
+class Content:
+    # Ores, drills, events, upgrade curves and market settings compiled from content/*.json
+    CACHE_VERSION = 3
+
+    def __init__(self, compiled):
+        self.ores = OreRegistry(compiled["ores"])
+        upgrades = compiled["upgrades"]
+        self.max_luck = upgrades["luck"]["max"]
+        self.energy_step = upgrades["energy"]["step"]
+        self.regen_minutes = upgrades["energy"]["regen_minutes"]
+        self.luck_curve = upgrades["luck"]["cost"]
+        self.energy_curve = upgrades["energy"]["cost"]
+        # JSON turns the luck keys into strings
+        self.sampling = {int(luck): (self.ores.unlocked(int(luck)), prob, alias)
+                         for luck, (prob, alias) in compiled["sampling"].items()}
+        self.drills = [name for name, _, _ in compiled["drills"]]
+        self.drill_speeds = {name: speed for name, speed, _ in compiled["drills"]}
+        self.drill_costs = {name: cost for name, _, cost in compiled["drills"]}
+        self.events = compiled["events"]
+        self.market = compiled["market"]
+
+    @staticmethod
+    def cost(curve, level):
+        return int(round((curve["base"] + curve["per_level"] * level) * curve.get("growth", 1.0) ** level))
+
+    def luck_cost(self, level):
+        return self.cost(self.luck_curve, level)
+
+    def energy_cost(self, level):
+        return self.cost(self.energy_curve, level)
+
+@functools.lru_cache(maxsize=None)
+def load_content(directory=None):
+    """Load the content tables, reusing the compiled cache while the files are unchanged."""
+    directory = directory or os.environ.get("DRILLING_CONTENT") or CONTENT_DIR
+    paths = {name: os.path.join(directory, f"{name}.json") for name in CONTENT_FILES}
+    stamps = {}
+    for name, path in paths.items():
+        stat = os.stat(path)
+        stamps[name] = [stat.st_mtime_ns, stat.st_size]
+    # One plain JSON cache per content folder, so loading it can never run code
+    key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"content-{key}.json")
+    cache = None
+    with contextlib.suppress(OSError, ValueError):
+        with open(cache_path, 'rb') as file:
+            cache = json.load(file)
+    if isinstance(cache, dict) and cache.get("version") == Content.CACHE_VERSION and cache.get("stamps") == stamps:
+        return Content(cache["compiled"])
+    raw = {}
+    for name, path in paths.items():
+        with open(path, 'rb') as file:
+            raw[name] = file.read()
+    hashes = {name: hashlib.sha256(data).hexdigest() for name, data in raw.items()}
+    if isinstance(cache, dict) and cache.get("version") == Content.CACHE_VERSION and cache.get("hashes") == hashes:
+        # Touched but unchanged files: keep the compiled tables, refresh the timestamps
+        compiled = cache["compiled"]
+    else:
+        tables = {}
+        for name, data in raw.items():
+            try:
+                tables[name] = json.loads(data)
+            except ValueError as error:
+                raise ValueError(f"{paths[name]}: {error}") from None
+        problems = validate_content(tables)
+        if problems:
+            raise ValueError("Invalid game content:\n  " + "\n  ".join(problems))
+        compiled = compile_content(tables)
+    with contextlib.suppress(OSError):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        atomic_write(cache_path, json.dumps({"version": Content.CACHE_VERSION, "stamps": stamps,
+                                             "hashes": hashes, "compiled": compiled}))
+    return Content(compiled)
+
+class GameEngine:
+    # Game rules with no terminal I/O; every action returns a result object
+
+    def __init__(self, data, rng=random, content=None, clock=time.time):
+        self.data = data
+        self.rng = rng
+        self.clock = clock  # Seconds since the epoch, for market prices
+        self.content = content or load_content()
+        self.ores = self.content.ores
+        self.sampler = OreSampler(self.ores, self.content.max_luck)
+        self.sampler.preload(self.content.sampling)
+        self.bulk_miner = BulkMiner(self.sampler, events=self.content.events)
+        self.stats = MiningStats(data, self.ores)
+        self.market = Market(data, self.content.market)
+        self.drill_speeds = self.content.drill_speeds
+        self.drill_costs = self.content.drill_costs
+        self.luck_cost = self.content.luck_cost
+        self.energy_cost = self.content.energy_cost
+        self.max_luck = self.content.max_luck
+        self.minutes_per_energy = self.content.regen_minutes
+        self.energy_step = self.content.energy_step
+
+    def ore_info(self, name):
+        return self.ores.get(name)
+
+    def unlocked_ores(self, luck=None):
+        if luck is None:
+            luck = self.data.get("luck")
+        return self.ores.unlocked(luck)
+
+    def drill_tier(self):
+        # A drill this content doesn't know (a renamed mod) counts as the starting one
+        drill = self.data.get("drill")
+        drills = self.content.drills
+        return drills.index(drill) if drill in self.drill_costs else 0
+
+    def next_drill(self):
+        drills = self.content.drills
+        index = self.drill_tier()
+        if index < len(drills) - 1:
+            return drills[index + 1], self.drill_costs[drills[index + 1]]
+        return None, None
+
+    def appraise(self, now=None):
+        """Return ([(ore, count, value), ...], total value) for the inventory at market prices."""
+        rows = []
+        total_value = 0
+        now = self.clock() if now is None else now
+        quote = self.market.quote
+        for ore_name, count in self.data.get("inventory", {}).items():
+            ore_info = self.ore_info(ore_name)
+            if ore_info:
+                value = quote(ore_info, count, now)
+                total_value += value
+                rows.append((ore_info, count, value))
+        return rows, total_value
+
+    def mine(self, count=None):
+        """Dig `count` times, or as often as energy allows when count is None."""
+        luck = self.data.get("luck")
+        if count is not None and count <= 0:
+            return MiningResult(False, "bad_count")
+        if not self.sampler.table(luck)[0]:
+            return MiningResult(False, "no_ores")
+        max_possible = self.data.get("energy") // BulkMiner.ENERGY_PER_DIG
+        result = MiningResult(True)
+        if count is None:
+            count = max_possible
+        elif count > max_possible:
+            count = max_possible
+            result.capped = True
+        if count <= 0:
+            return MiningResult(False, "no_energy")
+        
+        rng = self.rng
+        choose = self.sampler.choose
+        miner = self.bulk_miner
+        chance, pool = miner.event_chance, miner.event_pool
+        ore_counts = result.ore_counts
+        profiling = PROFILER.enabled
+        clock = time.perf_counter
+        with self.data.transaction():
+            for _ in range(count):
+                if profiling:
+                    start = clock()
+                    ore = choose(luck, rng)
+                    PROFILER.observe("mine.ore_roll", clock() - start)
+                else:
+                    ore = choose(luck, rng)
+                dig = DigResult(ore)
+                found = 1
+                
+                # Random events from the event table
+                if profiling:
+                    start = clock()
+                event = rng.random() < chance and rng.choice(pool)
+                if profiling:
+                    PROFILER.observe("mine.event_roll", clock() - start)
+                if event:
+                    dig.event = event
+                    if dig.event == "bonus":
+                        dig.amount = rng.randint(*miner.bonus_coins)
+                        self.data.add("coins", dig.amount)
+                        result.coins += dig.amount
+                    elif dig.event == "energy":
+                        dig.amount = rng.randint(*miner.crystal_energy)
+                        self.data.add("energy", dig.amount)
+                        result.energy += dig.amount
+                    elif dig.event == "double":
+                        found = 2
+                
+                self.data.update_inventory(ore.name, found)
+                ore_counts[ore.name] = ore_counts.get(ore.name, 0) + found
+                self.data.add("energy", -BulkMiner.ENERGY_PER_DIG)
+                self.data.add("drills_used")
+                result.energy -= BulkMiner.ENERGY_PER_DIG
+                result.digs.append(dig)
+            self.stats.record_digs(luck, result.digs, count * self.drill_speed(), result.coins)
+            if self.data.history is not None:
+                self.data.history.extend(luck, result.digs)
+        PROFILER.count("mine.digs", count)
+        return result
+
+    def drill_speed(self):
+        return self.drill_speeds[self.content.drills[self.drill_tier()]]
+
+    def mine_fast(self):
+        """Resolve digs until out of energy in one bulk step."""
+        luck = self.data.get("luck")
+        delta = self.bulk_miner.resolve(luck, self.data.get("energy"), rng=self.rng)
+        if delta.drills_used:
+            with self.data.transaction():
+                for ore_name, count in delta.ore_counts.items():
+                    self.data.update_inventory(ore_name, count)
+                self.data.add("coins", delta.coins)
+                self.data.add("energy", delta.energy)
+                self.data.add("drills_used", delta.drills_used)
+                self.stats.record_bulk(luck, delta, delta.drills_used * self.drill_speed())
+        return delta
+
+    def buy_luck(self):
+        luck = self.data.get("luck")
+        if luck >= self.max_luck:
+            return ActionResult(False, "maxed")
+        cost = self.luck_cost(luck)
+        if self.data.get("coins") < cost:
+            return ActionResult(False, "not_enough_coins", coins=-cost)
+        with self.data.transaction():
+            self.data.add("coins", -cost)
+            self.data.add("luck")
+        # Report newly unlocked ores
+        new_ores = self.ores.unlocked_at(luck + 1)
+        return ActionResult(True, coins=-cost, value=luck + 1, unlocked=new_ores)
+
+    def buy_drill(self):
+        next_drill, cost = self.next_drill()
+        if not next_drill:
+            return ActionResult(False, "maxed")
+        if self.data.get("coins") < cost:
+            return ActionResult(False, "not_enough_coins", coins=-cost, value=next_drill)
+        with self.data.transaction():
+            self.data.add("coins", -cost)
+            self.data.set("drill", next_drill)
+        return ActionResult(True, coins=-cost, value=next_drill)
+
+    def buy_energy(self):
+        max_energy = self.data.get("max_energy")
+        cost = self.energy_cost(max_energy // 100)
+        if self.data.get("coins") < cost:
+            return ActionResult(False, "not_enough_coins", coins=-cost)
+        new_max = max_energy + self.energy_step
+        with self.data.transaction():
+            self.data.add("coins", -cost)
+            self.data.set("max_energy", new_max)
+            self.data.set("energy", new_max)  # Refill on upgrade
+        return ActionResult(True, coins=-cost, value=new_max)
+
+    def sell_all(self):
+        now = self.clock()
+        rows, total_value = self.appraise(now)
+        if total_value <= 0:
+            return ActionResult(False, "nothing_to_sell")
+        sold = {ore.name: count for ore, count, _ in rows}
+        with self.data.transaction():
+            self.data.add("coins", total_value)
+            # Per-ore deltas rather than an empty inventory, so ores another process adds meanwhile survive
+            for ore_name, count in list(self.data.get("inventory").items()):
+                self.data.update_inventory(ore_name, -count)
+            self.market.record(sold, now)
+            self.stats.record_coins(total_value)
+        return ActionResult(True, coins=total_value, sold=sold)
+
+    def sell(self, ore_name, count=None):
+        """Sell `count` units of one ore, or all of it when count is None."""
+        held = self.data.get("inventory", {}).get(ore_name, 0)
+        count = held if count is None else max(0, min(count, held))
+        ore_info = self.ore_info(ore_name)
+        if not count or not ore_info:
+            return ActionResult(False, "unknown_ore")
+        now = self.clock()
+        value = self.market.quote(ore_info, count, now)
+        with self.data.transaction():
+            self.data.add("coins", value)
+            self.data.update_inventory(ore_name, -count)
+            self.market.record({ore_name: count}, now)
+            self.stats.record_coins(value)
+        return ActionResult(True, coins=value, sold={ore_name: count})
+
+    def rest(self):
+        energy = self.data.get("energy")
+        max_energy = self.data.get("max_energy")
+        if energy >= max_energy:
+            return ActionResult(False, "energy_full")
+        new_energy = min(energy + max_energy // 4, max_energy)
+        self.data.set("energy", new_energy)
+        return ActionResult(True, amount=new_energy - energy, value=new_energy)
+
+    def auto_drill(self, now=None):
+        """Spend the energy regenerated since last_played on idle digs, resolved in closed form."""
+        now = now or datetime.datetime.now()
+        try:
+            last_played = datetime.datetime.fromisoformat(self.data.get("last_played"))
+        except (TypeError, ValueError):
+            self.data.set("last_played", now.isoformat())
+            return MiningDelta()
+        seconds = max((now - last_played).total_seconds(), 0)
+        regenerated = int(seconds / 60 / self.minutes_per_energy)
+        drill_speed = self.drill_speed()
+        # The drill can't outpace its energy supply or its own speed
+        digs = min(regenerated // BulkMiner.ENERGY_PER_DIG, int(seconds / drill_speed))
+        # One multinomial draw around the expected counts, however long the absence
+        luck = self.data.get("luck")
+        delta = self.bulk_miner.resolve(luck, digs * BulkMiner.ENERGY_PER_DIG, count=digs, rng=self.rng)
+        # Energy the drill didn't use and any crystals it found top up the tank
+        spare = regenerated + delta.energy
+        energy = self.data.get("energy")
+        new_energy = min(energy + spare, self.data.get("max_energy"))
+        with self.data.transaction():
+            for ore_name, count in delta.ore_counts.items():
+                self.data.update_inventory(ore_name, count)
+            self.data.add("coins", delta.coins)
+            self.data.add("drills_used", delta.drills_used)
+            if delta.drills_used:
+                self.stats.record_bulk(luck, delta, delta.drills_used * drill_speed)
+            if new_energy > energy:
+                self.data.set("energy", new_energy)
+        delta.energy = max(new_energy - energy, 0)
+        return delta
+
+    def regen(self, now=None):
+        """Credit energy regenerated since last_played and return the gain."""
+        now = now or datetime.datetime.now()
         try:
-            last_played_str = self.data.get("last_played")
-            last_played = datetime.datetime.fromisoformat(last_played_str)
-            now = datetime.datetime.now()
+            last_played = datetime.datetime.fromisoformat(self.data.get("last_played"))
             minutes_passed = (now - last_played).total_seconds() / 60
-            energy_to_add = min(int(minutes_passed / 2), self.data.get("max_energy"))
+            max_energy = self.data.get("max_energy")
+            energy_to_add = min(int(minutes_passed / self.minutes_per_energy), max_energy)
             
             if energy_to_add > 0:
                 current = self.data.get("energy")
-                max_energy = self.data.get("max_energy")
                 new_energy = min(current + energy_to_add, max_energy)
                 self.data.set("energy", new_energy)
-                if new_energy > current:
-                    print(f"{Color.GREEN}+{new_energy - current} energy regenerated while away{Color.END}")
-        except:
-            self.data.set("last_played", datetime.datetime.now().isoformat())
+                return max(new_energy - current, 0)
+        except (TypeError, ValueError):
+            self.data.set("last_played", now.isoformat())
+        return 0
+
+    def resume(self, now=None):
+        """Credit the time since last_played: idle digs with auto-drill on, else regenerated energy."""
+        if self.data.get("auto_drill"):
+            return self.auto_drill(now)
+        return MiningDelta(energy=self.regen(now))
+
+@dataclass
+class PlanStep:
+    upgrade: str
+    label: str
+    cost: int
+    digs: float
+    seconds: float
+    rests: float
 
-    def clear_screen(self):
-        os.system('cls' if os.name == 'nt' else 'clear')
+class UpgradePlanner:
+    # Dynamic programming over (luck, drill tier, energy upgrades) states. Resting is free and
+    # instant, so a bigger tank never saves digs or drilling time; it only means fewer rests,
+    # and energy upgrades are only worth buying under the rests metric
+    GOALS = ("voidcore", "master", "complete")
+    METRICS = {"digs": "fewest digs", "seconds": "least drilling time", "rests": "fewest rests"}
+    MAX_ENERGY_TIER = 40  # Energy upgrades the rests metric considers buying
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.drills = list(engine.drill_costs)
+        self._income = None
+        self._memo = {}
+
+    def invalidate(self):
+        self._income = None
+        self._memo = {}
+
+    def income_table(self):
+        """Expected coins per dig for every luck level."""
+        if self._income is None:
+            miner = self.engine.bulk_miner
+            double = miner.event_rate("double")
+            treasure = miner.event_rate("bonus") * sum(miner.bonus_coins) / 2
+            self._income = []
+            for luck in range(self.engine.max_luck + 1):
+                ores = self.engine.sampler.table(luck)[0]
+                total = sum(ore.weight for ore in ores) or 1
+                ore_value = sum(ore.weight * ore.price for ore in ores) / total
+                # Double deposits add one more ore, treasures add coins
+                self._income.append(ore_value * (1 + double) + treasure)
+        return self._income
+
+    def goal_state(self, goal):
+        if goal == "voidcore":
+            return self.engine.ores.max_level, 0, 0
+        if goal == "master":
+            return 0, len(self.drills) - 1, 0
+        return self.engine.max_luck, len(self.drills) - 1, 0
+
+    def state(self):
+        data = self.engine.data
+        energy_level = (data.get("max_energy") - 100) // self.engine.energy_step
+        return data.get("luck"), self.engine.drill_tier(), energy_level
+
+    def max_energy(self, state):
+        return 100 + state[2] * self.engine.energy_step
+
+    def actions(self, state, target, metric):
+        luck, drill, energy = state
+        engine = self.engine
+        if luck < engine.max_luck:
+            yield "luck", f"Luck {luck + 1}", engine.luck_cost(luck), (luck + 1, drill, energy)
+        if drill < len(self.drills) - 1 and (metric == "seconds" or drill < target[1]):
+            name = self.drills[drill + 1]
+            yield "drill", name, engine.drill_costs[name], (luck, drill + 1, energy)
+        if energy < target[2] or metric == "rests" and energy < self.MAX_ENERGY_TIER:
+            max_energy = self.max_energy(state)
+            yield ("energy", f"Energy {max_energy + engine.energy_step}",
+                   engine.energy_cost(max_energy // 100), (luck, drill, energy + 1))
+
+    def rests(self, state, digs):
+        # Each rest refills a quarter of the tank
+        return digs * BulkMiner.ENERGY_PER_DIG / (self.max_energy(state) // 4)
+
+    def step_cost(self, state, cost, metric):
+        digs = cost / self.income_table()[state[0]]
+        if metric == "seconds":
+            return digs * self.engine.drill_speeds[self.drills[state[1]]]
+        if metric == "rests":
+            return self.rests(state, digs)
+        return digs
+
+    def best(self, state, target, metric):
+        """Return (expected cost to reach target, best next action) from state."""
+        memo = self._memo.setdefault((target, metric), {})
+        if state in memo:
+            return memo[state]
+        if all(have >= need for have, need in zip(state, target)):
+            memo[state] = (0.0, None)
+            return memo[state]
+        best = (math.inf, None)
+        for action in self.actions(state, target, metric):
+            total = self.step_cost(state, action[2], metric) + self.best(action[3], target, metric)[0]
+            if total < best[0]:
+                best = (total, action)
+        memo[state] = best
+        return best
+
+    def plan(self, goal="complete", metric="digs", state=None, coins=None):
+        """Cheapest upgrade order from state (default: the current profile) to goal."""
+        target = self.goal_state(goal)
+        state = state or self.state()
+        if coins is None:
+            coins = self.engine.data.get("coins") + self.engine.appraise()[1]
+        steps = []
+        while self.best(state, target, metric)[1] is not None:
+            # Coins already on hand discount the next purchase
+            _, action = min(((self.step_cost(state, max(0, a[2] - coins), metric)
+                              + self.best(a[3], target, metric)[0], a)
+                             for a in self.actions(state, target, metric)),
+                            key=lambda option: option[0])
+            upgrade, label, cost, next_state = action
+            digs = max(0, cost - coins) / self.income_table()[state[0]]
+            seconds = digs * self.engine.drill_speeds[self.drills[state[1]]]
+            steps.append(PlanStep(upgrade, label, cost, digs, seconds, self.rests(state, digs)))
+            coins = max(0, coins - cost)
+            state = next_state
+        return steps
+
+def print_plan(steps, out=print):
+    if not steps:
+        out(f"{Color.GREEN}Goal already reached{Color.END}")
+        return
+    total_digs = 0
+    total_seconds = 0
+    total_rests = 0
+    for i, step in enumerate(steps, 1):
+        total_digs += step.digs
+        total_seconds += step.seconds
+        total_rests += step.rests
+        out(f"{i:>2}) {step.label:<16} {step.cost:>6} coins | ~{round(step.digs):>4} digs "
+              f"(total ~{round(total_digs)} digs, {total_seconds / 60:.1f} min drilling, "
+              f"{round(total_rests)} rests)")
+
+ANSI_CODE = re.compile(r'\033\[[0-9;]*[A-Za-z]')
+
+class Renderer:
+    # Builds each screen in a frame buffer and repaints only the changed lines in one write
+    def __init__(self, stream=None, ansi=None):
+        self.stream = stream or sys.stdout
+        self.ansi = self.stream.isatty() if ansi is None else ansi
+        self.frame = [""]  # Last entry is the line still being written
+        self.screen = None  # Lines currently on the terminal, None when unknown
+        self.height = None  # Terminal height the screen was painted for
+        self.flushed = 0  # Plain mode: complete lines already written
+        self.label = "screen"  # Names the frame in profiling reports
+        self.drawing = None  # perf_counter() of the last clear while profiling
+
+    def clear(self, label="screen"):
+        self.frame = [""]
+        self.flushed = 0
+        if PROFILER.enabled:
+            self.label = label
+            self.drawing = time.perf_counter()
+
+    def print(self, *values, sep=" ", end="\n"):
+        lines = (sep.join(str(value) for value in values) + end).split("\n")
+        self.frame[-1] += lines[0]
+        self.frame.extend(lines[1:])
+
+    def present(self):
+        self.paint()
+        if self.drawing is not None:
+            # Time from clearing the frame to its first paint
+            PROFILER.observe(f"render.{self.label}", time.perf_counter() - self.drawing)
+            self.drawing = None
+
+    def paint(self):
+        if not self.ansi:
+            # Plain output (pipes, dumb terminals): append the completed lines
+            self.stream.write("".join(line + "\n" for line in self.frame[self.flushed:-1]))
+            self.flushed = len(self.frame) - 1
+            self.stream.flush()
+            return
+        height = shutil.get_terminal_size().lines
+        # A frame taller than the terminal keeps its last lines, where the prompt is
+        lines = self.frame[-max(height - 1, 1):]
+        rows = len(lines)
+        if self.screen is None or height != self.height:
+            # Unknown screen or a resized terminal, repaint everything
+            out = ["\033[H\033[2J", "\n".join(lines)]
+        else:
+            out = []
+            for row, line in enumerate(lines):
+                if row >= len(self.screen) or self.screen[row] != line:
+                    out.append(f"\033[{row + 1};1H{line}\033[K")
+            if len(self.screen) > rows:
+                out.append(f"\033[{rows + 1};1H\033[J")
+            # Park the cursor at the end of the last line
+            out.append(f"\033[{rows};{len(ANSI_CODE.sub('', lines[-1])) + 1}H")
+        self.screen = list(lines)
+        self.height = height
+        self.stream.write("".join(out))
+        self.stream.flush()
+
+    def input(self, prompt=""):
+        self.print(prompt, end="")
+        self.present()
+        if not self.ansi:
+            self.stream.write(self.frame[-1])
+            self.stream.flush()
+        answer = input()
+        # The terminal echoed the answer and moved to the next line
+        self.frame[-1] += answer
+        if self.screen is not None:
+            self.screen[-1] = self.frame[-1]
+        self.frame.append("")
+        self.flushed = len(self.frame) - 1
+        return answer
+
+class DigScheduler:
+    # Replays precomputed digs on a fixed frame tick; the drill speed sets digs per tick
+    TICK = 0.05
+    ANIMATION_BUDGET = 5.0  # Longest replay in seconds, for the slowest drill
+
+    def __init__(self, count, drill_speed, slowest_speed, tick=TICK):
+        self.count = count
+        self.tick = tick
+        # Faster drills replay faster, and long runs are compressed into the budget
+        budget = self.ANIMATION_BUDGET * drill_speed / slowest_speed
+        self.digs_per_tick = max(tick / drill_speed, count * tick / budget)
+        self.game_seconds = count * drill_speed
+
+    def ticks(self):
+        """Yield the number of digs revealed after each tick."""
+        shown = 0.0
+        while shown < self.count:
+            shown = min(self.count, shown + self.digs_per_tick)
+            yield int(shown)
+
+class KeyWatcher:
+    # Detects a single keypress without Enter while an animation plays
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.saved = None
+
+    def __enter__(self):
+        if termios and self.stream.isatty():
+            self.saved = termios.tcgetattr(self.stream)
+            tty.setcbreak(self.stream)
+        return self
+
+    def __exit__(self, *exc):
+        if self.saved is not None:
+            termios.tcsetattr(self.stream, termios.TCSADRAIN, self.saved)
+            self.saved = None
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, return True as soon as a key is pressed."""
+        if self.saved is not None:
+            ready, _, _ = select.select([self.stream], [], [], timeout)
+            if ready:
+                os.read(self.stream.fileno(), 1024)
+                return True
+            return False
+        if msvcrt and self.stream.isatty():
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                if msvcrt.kbhit():
+                    msvcrt.getwch()
+                    return True
+                time.sleep(0.01)
+            return False
+        time.sleep(timeout)
+        return False
+
+class ScriptedRenderer(Renderer):
+    # Answers prompts from a list instead of the keyboard, EOFError when it runs out
+    def __init__(self, answers=(), stream=None, ansi=False):
+        super().__init__(stream or io.StringIO(), ansi)
+        self.answers = list(answers)
+
+    def input(self, prompt=""):
+        self.print(prompt, end="")
+        self.present()
+        if not self.answers:
+            raise EOFError
+        answer = self.answers.pop(0)
+        self.print(answer)
+        return answer
+
+class MiningGame:
+    def __init__(self, data=None, ui=None, seed=None, now=None, clock=time.time):
+        self.data = data or UserDataManager()
+        self.ui = ui or Renderer()
+        # Every roll comes from this generator so a session can be replayed from its seed
+        self.seed = random.randrange(1 << 63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.clock = clock
+        self.engine = GameEngine(self.data, rng=self.rng, clock=clock)
+        self.planner = UpgradePlanner(self.engine)
+        self.notices = []  # Shown under the header of the next main menu, then dropped
+        self.check_energy_regen(now)
+
+    @PROFILER.timed("regen")
+    def check_energy_regen(self, now=None):
+        start = time.perf_counter()
+        delta = self.engine.resume(now)
+        elapsed = time.perf_counter() - start
+        notices = self.notices
+        if delta.drills_used:
+            notices.append(f"{Color.GREEN}Your drill dug {delta.drills_used} times while you were away "
+                           f"(resolved in {elapsed * 1000:.1f} ms){Color.END}")
+            for ore in self.engine.ores:
+                count = delta.ore_counts.get(ore.name)
+                if count:
+                    notices.append(f"  {ore.color}{ore.name}{Color.END}: +{count}")
+            if delta.coins:
+                notices.append(f"  Treasure: +{delta.coins} coins")
+        if delta.energy:
+            notices.append(f"{Color.GREEN}+{delta.energy} energy regenerated while away{Color.END}")
+
+    def clear_screen(self, label):
+        # The label names the menu's frame in profiling reports
+        self.ui.clear(label)
 
     def display_header(self):
         name = self.data.get("name")
@@ -142,121 +2659,136 @@ class MiningGame:
         max_energy = self.data.get("max_energy")
         drill = self.data.get("drill")
         
-        print(f"{Color.BLUE}===== UNDERGROUND MINER ====={Color.END}")
-        print(f"Miner: {name} | 💰 {coins} | 🍀 {luck} | ⚡ {energy}/{max_energy}")
-        print(f"Drill: {drill}")
-        print(f"{Color.BLUE}============================={Color.END}")
+        self.ui.print(f"{Color.BLUE}===== UNDERGROUND MINER ====={Color.END}")
+        self.ui.print(f"Miner: {name} | 💰 {coins} | 🍀 {luck} | ⚡ {energy}/{max_energy}")
+        self.ui.print(f"Drill: {drill}")
+        self.ui.print(f"{Color.BLUE}============================={Color.END}")
+        for error in self.data.take_errors():
+            self.ui.print(f"{Color.RED}{error}{Color.END}")
 
     def wait_for_key(self):
-        input("\nPress Enter to continue...")
+        self.ui.input("\nPress Enter to continue...")
 
     def mine(self):
-        luck = self.data.get("luck")
         energy = self.data.get("energy")
-        drill = self.data.get("drill")
         
-        unlocked_ores = [ore for ore in self.ores if ore["min_luck"] <= luck]
-        if not unlocked_ores:
-            print(f"{Color.RED}No ores available with your current luck!{Color.END}")
+        if not self.engine.unlocked_ores():
+            self.ui.print(f"{Color.RED}No ores available with your current luck!{Color.END}")
             return
             
-        print(f"\n{Color.BLUE}MINING{Color.END}")
-        print(f"Energy: {energy}")
-        print("How many times to mine?")
-        print("1) Once")
-        print("2) Five times")
-        print("3) Ten times")
-        print("4) Until out of energy")
-        print("0) Back")
+        self.ui.print(f"\n{Color.BLUE}MINING{Color.END}")
+        self.ui.print(f"Energy: {energy}")
+        self.ui.print("How many times to mine?")
+        self.ui.print("1) Once")
+        self.ui.print("2) Five times")
+        self.ui.print("3) Ten times")
+        self.ui.print("4) Until out of energy")
+        self.ui.print("5) Fast resolve (until out of energy)")
+        self.ui.print("0) Back")
         
-        choice = input("> ")
+        choice = self.ui.input("> ")
         if choice == '0':
             return
-            
-        count = 0
-        if choice == '1':
-            count = 1
-        elif choice == '2':
-            count = 5
-        elif choice == '3':
-            count = 10
-        elif choice == '4':
-            count = energy // 5  # 5 energy per mine
-        else:
-            print(f"{Color.RED}Invalid choice{Color.END}")
+        if choice == '5':
+            self.fast_resolve()
             return
             
-        if count <= 0:
-            print(f"{Color.RED}Cannot mine that many times{Color.END}")
+        counts = {'1': 1, '2': 5, '3': 10, '4': None}
+        if choice not in counts:
+            self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
             return
             
-        max_possible = energy // 5
-        if count > max_possible:
-            print(f"{Color.YELLOW}Only enough energy for {max_possible} mines{Color.END}")
-            count = max_possible
-        
-        drill_speed = self.drill_speeds.get(drill, 0.5)
+        result = self.engine.mine(counts[choice])
+        if not result.ok:
+            self.ui.print(f"{Color.RED}Cannot mine that many times{Color.END}")
+            return
+        if result.capped:
+            self.ui.print(f"{Color.YELLOW}Only enough energy for {len(result.digs)} mines{Color.END}")
         
-        self.clear_screen()
-        print(f"{Color.BLUE}Mining in progress...{Color.END}")
+        drill_speed = self.engine.drill_speed()
+        scheduler = DigScheduler(len(result.digs), drill_speed, max(self.engine.drill_speeds.values()))
         
-        for i in range(count):
-            # Calculate weighted probability
-            total_weight = sum(ore["weight"] for ore in unlocked_ores)
-            r = random.uniform(0, total_weight)
-            cumulative = 0
-            selected_ore = unlocked_ores[0]
-            
-            for ore in unlocked_ores:
-                cumulative += ore["weight"]
-                if r <= cumulative:
-                    selected_ore = ore
-                    break
-            
-            # Random events (10% chance)
-            if random.random() < 0.1:
-                event_type = random.choice(["bonus", "energy", "double", "empty"])
-                if event_type == "bonus":
-                    coins = random.randint(1, 10)
-                    self.data.add("coins", coins)
-                    print(f"{Color.GREEN}Found a small treasure! +{coins} coins{Color.END}")
-                elif event_type == "energy":
-                    e_gain = random.randint(5, 15)
-                    self.data.add("energy", e_gain)
-                    print(f"{Color.GREEN}Found an energy crystal! +{e_gain} energy{Color.END}")
-                elif event_type == "double":
-                    print(f"{Color.GREEN}Found a double deposit!{Color.END}")
-                    self.data.update_inventory(selected_ore["name"], 1)  # Double ore
-                elif event_type == "empty":
-                    print(f"{Color.RED}Hit a empty patch. Nothing found.{Color.END}")
-                    # Still costs energy but no ore
-            
-            # Add ore to inventory
-            self.data.update_inventory(selected_ore["name"], 1)
-            
-            # Use energy
-            self.data.add("energy", -5)
-            self.data.add("drills_used")
-            
-            print(f"[{i+1}/{count}] Found: {selected_ore['color']}{selected_ore['name']}{Color.END}")
-            time.sleep(drill_speed)
+        # The digs are already resolved, this only replays them
+        tally = {}
+        shown = 0
+        last_event = None
+        if self.ui.ansi and not self.data.get("instant_mining"):
+            with KeyWatcher() as keys:
+                for revealed in scheduler.ticks():
+                    if revealed > shown:
+                        last_event = self.draw_mining(result.digs, shown, revealed, tally, last_event)
+                        self.ui.print(f"\n{Color.BLUE}Press any key to skip{Color.END}")
+                        self.ui.present()
+                        shown = revealed
+                    if keys.wait(scheduler.tick):
+                        break
+        self.draw_mining(result.digs, shown, len(result.digs), tally, last_event)
         
         # Summary
-        print(f"\n{Color.GREEN}Mining complete!{Color.END}")
-        print(f"Energy remaining: {self.data.get('energy')}/{self.data.get('max_energy')}")
+        self.ui.print(f"\n{Color.GREEN}Mining complete!{Color.END}")
+        self.ui.print(f"Drilling time: {scheduler.game_seconds:.1f}s")
+        self.ui.print(f"Energy remaining: {self.data.get('energy')}/{self.data.get('max_energy')}")
+        self.wait_for_key()
+    
+    def draw_mining(self, digs, start, end, tally, last_event):
+        # Fold digs[start:end] into the tally and redraw it in place
+        for dig in digs[start:end]:
+            tally[dig.ore] = tally.get(dig.ore, 0) + (2 if dig.event == "double" else 1)
+            if dig.event:
+                last_event = dig
+        event_text = ""
+        if last_event is None:
+            pass
+        elif last_event.event == "bonus":
+            event_text = f"{Color.GREEN}Found a small treasure! +{last_event.amount} coins{Color.END}"
+        elif last_event.event == "energy":
+            event_text = f"{Color.GREEN}Found an energy crystal! +{last_event.amount} energy{Color.END}"
+        elif last_event.event == "double":
+            event_text = f"{Color.GREEN}Found a double deposit!{Color.END}"
+        elif last_event.event == "empty":
+            event_text = f"{Color.RED}Hit a empty patch. Nothing found.{Color.END}"
+        
+        ore = digs[end - 1].ore
+        self.clear_screen("draw_mining")
+        self.ui.print(f"{Color.BLUE}Mining in progress...{Color.END}")
+        self.ui.print(f"[{end}/{len(digs)}] Found: {ore.color}{ore.name}{Color.END}")
+        self.ui.print(event_text)
+        self.ui.print()
+        for tally_ore in sorted(tally, key=lambda o: o.id):
+            self.ui.print(f"{tally_ore.color}{tally_ore.name}{Color.END}: {tally[tally_ore]}")
+        return last_event
+    
+    def fast_resolve(self):
+        start = time.perf_counter()
+        delta = self.engine.mine_fast()
+        elapsed = time.perf_counter() - start
+        if not delta.drills_used:
+            self.ui.print(f"{Color.RED}Cannot mine that many times{Color.END}")
+            return
+        
+        self.ui.print(f"\n{Color.GREEN}Resolved {delta.drills_used} digs in {elapsed * 1000:.1f} ms{Color.END}")
+        for ore in self.engine.ores:
+            count = delta.ore_counts.get(ore.name)
+            if count:
+                self.ui.print(f"{ore.color}{ore.name}{Color.END}: +{count}")
+        events = delta.events
+        self.ui.print(f"Treasures: {events['bonus']} (+{delta.coins} coins) | Energy crystals: {events['energy']} | "
+              f"Double deposits: {events['double']} | Empty patches: {events['empty']}")
+        self.ui.print(f"Energy remaining: {self.data.get('energy')}/{self.data.get('max_energy')}")
+        self.wait_for_key()
     
     def show_shop(self):
         while True:
-            self.clear_screen()
+            self.clear_screen("show_shop")
             self.display_header()
             
-            print(f"\n{Color.BLUE}SHOP{Color.END}")
-            print("1) Buy Upgrades")
-            print("2) Sell Ores")
-            print("3) Rest (Recover Energy)")
-            print("0) Back")
+            self.ui.print(f"\n{Color.BLUE}SHOP{Color.END}")
+            self.ui.print("1) Buy Upgrades")
+            self.ui.print("2) Sell Ores")
+            self.ui.print("3) Rest (Recover Energy)")
+            self.ui.print("0) Back")
             
-            choice = input("> ")
+            choice = self.ui.input("> ")
             
             if choice == '1':
                 self.show_upgrades()
@@ -267,11 +2799,12 @@ class MiningGame:
             elif choice == '0':
                 break
             else:
-                print(f"{Color.RED}Invalid choice{Color.END}")
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
     
     def show_upgrades(self):
+        engine = self.engine
         while True:
-            self.clear_screen()
+            self.clear_screen("show_upgrades")
             self.display_header()
             
             coins = self.data.get("coins")
@@ -279,294 +2812,374 @@ class MiningGame:
             drill = self.data.get("drill")
             max_energy = self.data.get("max_energy")
             
-            next_luck_cost = self.luck_cost(luck)
-            next_energy_cost = self.energy_cost(max_energy // 100)
-            
-            drills = list(self.drill_costs.keys())
-            current_drill_index = drills.index(drill)
-            next_drill = None
-            next_drill_cost = None
+            next_luck_cost = engine.luck_cost(luck)
+            next_energy_cost = engine.energy_cost(max_energy // 100)
+            next_drill, next_drill_cost = engine.next_drill()
             
-            if current_drill_index < len(drills) - 1:
-                next_drill = drills[current_drill_index + 1]
-                next_drill_cost = self.drill_costs[next_drill]
+            self.ui.print(f"\n{Color.BLUE}UPGRADES{Color.END}")
+            self.ui.print(f"Available coins: {coins}")
             
-            print(f"\n{Color.BLUE}UPGRADES{Color.END}")
-            print(f"Available coins: {coins}")
-            
-            print("\n1) Upgrade Luck")
-            if luck < 20:
-                print(f"   Current: {luck}/20 | Cost: {next_luck_cost} coins")
+            self.ui.print("\n1) Upgrade Luck")
+            if luck < engine.max_luck:
+                self.ui.print(f"   Current: {luck}/{engine.max_luck} | Cost: {next_luck_cost} coins")
             else:
-                print(f"   {Color.GREEN}MAXED{Color.END}")
+                self.ui.print(f"   {Color.GREEN}MAXED{Color.END}")
                 
-            print("\n2) Upgrade Drill")
+            self.ui.print("\n2) Upgrade Drill")
             if next_drill:
-                print(f"   Current: {drill}")
-                print(f"   Next: {next_drill} | Cost: {next_drill_cost} coins")
+                self.ui.print(f"   Current: {drill}")
+                self.ui.print(f"   Next: {next_drill} | Cost: {next_drill_cost} coins")
             else:
-                print(f"   {Color.GREEN}MAXED{Color.END}")
+                self.ui.print(f"   {Color.GREEN}MAXED{Color.END}")
                 
-            print("\n3) Upgrade Energy Capacity")
-            print(f"   Current: {max_energy} | Cost: {next_energy_cost} coins")
-            
-            print("\n0) Back")
-            
-            choice = input("> ")
-            
-            if choice == '1' and luck < 20:
-                # Upgrade luck
-                if coins >= next_luck_cost:
-                    self.data.add("coins", -next_luck_cost)
-                    self.data.add("luck")
-                    print(f"{Color.GREEN}Luck upgraded to {luck + 1}!{Color.END}")
-                    
-                    # Check for newly unlocked ores
-                    new_luck = luck + 1
-                    new_ores = [ore for ore in self.ores if ore["min_luck"] == new_luck]
-                    
-                    if new_ores:
-                        print(f"{Color.BLUE}New ores unlocked:{Color.END}")
-                        for ore in new_ores:
-                            print(f"- {ore['color']}{ore['name']}{Color.END}")
+            self.ui.print("\n3) Upgrade Energy Capacity")
+            self.ui.print(f"   Current: {max_energy} | Cost: {next_energy_cost} coins")
+            
+            steps = self.planner.plan("complete")
+            self.ui.print("\n4) Advisor")
+            if steps:
+                self.ui.print(f"   Next: {steps[0].label} | ~{round(sum(step.digs for step in steps))} digs to finish")
+            else:
+                self.ui.print(f"   {Color.GREEN}Nothing left to buy{Color.END}")
+            
+            self.ui.print("\n0) Back")
+            
+            choice = self.ui.input("> ")
+            
+            if choice == '1' and luck < engine.max_luck:
+                result = engine.buy_luck()
+                if result.ok:
+                    self.ui.print(f"{Color.GREEN}Luck upgraded to {result.value}!{Color.END}")
+                    if result.unlocked:
+                        self.ui.print(f"{Color.BLUE}New ores unlocked:{Color.END}")
+                        for ore in result.unlocked:
+                            self.ui.print(f"- {ore.color}{ore.name}{Color.END}")
                 else:
-                    print(f"{Color.RED}Not enough coins{Color.END}")
+                    self.ui.print(f"{Color.RED}Not enough coins{Color.END}")
                 self.wait_for_key()
                 
             elif choice == '2' and next_drill:
-                # Upgrade drill
-                if coins >= next_drill_cost:
-                    self.data.add("coins", -next_drill_cost)
-                    self.data.set("drill", next_drill)
-                    print(f"{Color.GREEN}Drill upgraded to {next_drill}!{Color.END}")
+                result = engine.buy_drill()
+                if result.ok:
+                    self.ui.print(f"{Color.GREEN}Drill upgraded to {result.value}!{Color.END}")
                 else:
-                    print(f"{Color.RED}Not enough coins{Color.END}")
+                    self.ui.print(f"{Color.RED}Not enough coins{Color.END}")
                 self.wait_for_key()
                 
             elif choice == '3':
-                # Upgrade energy
-                if coins >= next_energy_cost:
-                    self.data.add("coins", -next_energy_cost)
-                    new_max = max_energy + 25
-                    self.data.set("max_energy", new_max)
-                    self.data.set("energy", new_max)  # Refill on upgrade
-                    print(f"{Color.GREEN}Energy capacity upgraded to {new_max}!{Color.END}")
+                result = engine.buy_energy()
+                if result.ok:
+                    self.ui.print(f"{Color.GREEN}Energy capacity upgraded to {result.value}!{Color.END}")
                 else:
-                    print(f"{Color.RED}Not enough coins{Color.END}")
+                    self.ui.print(f"{Color.RED}Not enough coins{Color.END}")
                 self.wait_for_key()
                 
+            elif choice == '4':
+                self.show_advisor()
+                
             elif choice == '0':
                 break
                 
             else:
-                print(f"{Color.RED}Invalid choice{Color.END}")
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
+                self.wait_for_key()
+    
+    def show_advisor(self):
+        goals = {'1': ("voidcore", "Unlock Voidcore"), '2': ("master", "Reach Master Drill"),
+                 '3': ("complete", "Max luck and Master Drill")}
+        metric = "digs"
+        while True:
+            self.clear_screen("show_advisor")
+            self.display_header()
+            
+            self.ui.print(f"\n{Color.BLUE}ADVISOR{Color.END}")
+            self.ui.print(f"Optimizing for: {UpgradePlanner.METRICS[metric]}")
+            for key, (_, label) in goals.items():
+                self.ui.print(f"{key}) {label}")
+            self.ui.print("4) Switch between digs, drilling time and rests")
+            self.ui.print("0) Back")
+            
+            choice = self.ui.input("> ")
+            if choice in goals:
+                goal, label = goals[choice]
+                self.ui.print(f"\n{Color.BLUE}{label}{Color.END}")
+                print_plan(self.planner.plan(goal, metric), self.ui.print)
+                self.wait_for_key()
+            elif choice == '4':
+                metrics = list(UpgradePlanner.METRICS)
+                metric = metrics[(metrics.index(metric) + 1) % len(metrics)]
+            elif choice == '0':
+                break
+            else:
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
                 self.wait_for_key()
     
     def sell_ores(self):
-        inventory = self.data.get("inventory", {})
-        
-        if not inventory:
-            print(f"{Color.RED}No ores to sell{Color.END}")
+        if not self.data.get("inventory", {}):
+            self.ui.print(f"{Color.RED}No ores to sell{Color.END}")
             self.wait_for_key()
             return
             
         while True:
-            self.clear_screen()
+            self.clear_screen("sell_ores")
             self.display_header()
             
-            total_value = 0
-            ore_values = {}
+            now = self.engine.clock()
+            rows, total_value = self.engine.appraise(now)
             
-            print(f"\n{Color.BLUE}SELL ORES{Color.END}")
-            print("Your inventory:")
+            self.ui.print(f"\n{Color.BLUE}SELL ORES{Color.END}")
+            self.ui.print("Your inventory:")
             
-            # Find ore info and calculate values
-            for i, (ore_name, count) in enumerate(inventory.items(), 1):
-                ore_info = next((ore for ore in self.ores if ore["name"] == ore_name), None)
-                if ore_info:
-                    value = count * ore_info["price"]
-                    total_value += value
-                    ore_values[ore_name] = value
-                    print(f"{i}) {ore_info['color']}{ore_name}{Color.END}: {count} (Value: {value} coins)")
+            for i, (ore_info, count, value) in enumerate(rows, 1):
+                self.ui.print(f"{i}) {ore_info.color}{ore_info.name}{Color.END}: {count} "
+                              f"(Value: {value} coins{self.market_note(ore_info, now)})")
             
-            print(f"\nTotal value: {total_value} coins")
-            print("\nOptions:")
-            print("1) Sell all ores")
-            print("2) Sell specific ore")
-            print("0) Back")
+            self.ui.print(f"\nTotal value: {total_value} coins")
+            self.ui.print("\nOptions:")
+            self.ui.print("1) Sell all ores")
+            self.ui.print("2) Sell specific ore")
+            self.ui.print("0) Back")
             
-            choice = input("> ")
+            choice = self.ui.input("> ")
             
             if choice == '1':
-                # Sell all
-                if total_value > 0:
-                    self.data.add("coins", total_value)
-                    for ore_name in list(inventory.keys()):
-                        inventory[ore_name] = 0
-                    self.data.set("inventory", {})
-                    print(f"{Color.GREEN}Sold all ores for {total_value} coins{Color.END}")
+                result = self.engine.sell_all()
+                if result.ok:
+                    self.ui.print(f"{Color.GREEN}Sold all ores for {result.coins} coins{Color.END}")
                 else:
-                    print(f"{Color.RED}No ores to sell{Color.END}")
+                    self.ui.print(f"{Color.RED}No ores to sell{Color.END}")
                 self.wait_for_key()
                 break
                 
             elif choice == '2':
-                # Sell specific
-                print("\nEnter the number of the ore to sell:")
+                self.ui.print("\nEnter the number of the ore to sell:")
                 try:
-                    ore_idx = int(input("> ")) - 1
-                    ore_names = list(inventory.keys())
-                    if 0 <= ore_idx < len(ore_names):
-                        ore_name = ore_names[ore_idx]
-                        count = inventory[ore_name]
-                        value = ore_values[ore_name]
-                        
-                        self.data.add("coins", value)
-                        inventory.pop(ore_name)
-                        self.data.set("inventory", inventory)
-                        
-                        print(f"{Color.GREEN}Sold {count} {ore_name} for {value} coins{Color.END}")
+                    ore_idx = int(self.ui.input("> ")) - 1
+                    if 0 <= ore_idx < len(rows):
+                        ore_name = rows[ore_idx][0].name
+                        result = self.engine.sell(ore_name)
+                        self.ui.print(f"{Color.GREEN}Sold {result.sold[ore_name]} {ore_name} for {result.coins} coins{Color.END}")
                     else:
-                        print(f"{Color.RED}Invalid selection{Color.END}")
+                        self.ui.print(f"{Color.RED}Invalid selection{Color.END}")
                 except ValueError:
-                    print(f"{Color.RED}Invalid input{Color.END}")
+                    self.ui.print(f"{Color.RED}Invalid input{Color.END}")
                 self.wait_for_key()
                 
             elif choice == '0':
                 break
                 
             else:
-                print(f"{Color.RED}Invalid choice{Color.END}")
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
                 self.wait_for_key()
     
+    def market_note(self, ore, now):
+        # How far recent sales have pushed the price below normal
+        level = self.engine.market.price(ore, now) / ore.price if ore.price else 1.0
+        return f", market {level:.0%}" if level < 0.995 else ""
+    
     def rest(self):
-        energy = self.data.get("energy")
-        max_energy = self.data.get("max_energy")
+        result = self.engine.rest()
         
-        if energy >= max_energy:
-            print(f"{Color.YELLOW}Energy already full!{Color.END}")
+        if not result.ok:
+            self.ui.print(f"{Color.YELLOW}Energy already full!{Color.END}")
         else:
-            gain = max_energy // 4
-            new_energy = min(energy + gain, max_energy)
-            self.data.set("energy", new_energy)
-            print(f"{Color.GREEN}Rested and recovered {gain} energy.{Color.END}")
-            print(f"Energy: {new_energy}/{max_energy}")
+            self.ui.print(f"{Color.GREEN}Rested and recovered {result.amount} energy.{Color.END}")
+            self.ui.print(f"Energy: {result.value}/{self.data.get('max_energy')}")
         
         self.wait_for_key()
     
     def show_inventory(self):
         inventory = self.data.get("inventory", {})
         
-        self.clear_screen()
+        self.clear_screen("show_inventory")
         self.display_header()
         
-        print(f"\n{Color.BLUE}INVENTORY{Color.END}")
+        self.ui.print(f"\n{Color.BLUE}INVENTORY{Color.END}")
         
+        now = self.engine.clock()
         if not inventory:
-            print("Empty")
+            self.ui.print("Empty")
         else:
-            total_value = 0
-            for ore_name, count in inventory.items():
-                ore_info = next((ore for ore in self.ores if ore["name"] == ore_name), None)
-                if ore_info:
-                    value = count * ore_info["price"]
-                    total_value += value
-                    print(f"{ore_info['color']}{ore_name}{Color.END}: {count} (Value: {value} coins)")
-            
-            print(f"\nTotal value: {total_value} coins")
+            rows, total_value = self.engine.appraise(now)
+            for ore_info, count, value in rows:
+                self.ui.print(f"{ore_info.color}{ore_info.name}{Color.END}: {count} (Value: {value} coins)")
+            
+            self.ui.print(f"\nTotal value: {total_value} coins")
         
         # Show available ores
         luck = self.data.get("luck")
-        print(f"\n{Color.BLUE}AVAILABLE ORES:{Color.END}")
-        current_ores = [ore for ore in self.ores if ore["min_luck"] <= luck]
-        for ore in current_ores:
-            print(f"- {ore['color']}{ore['name']}{Color.END} (Value: {ore['price']} coins)")
+        self.ui.print(f"\n{Color.BLUE}AVAILABLE ORES:{Color.END}")
+        for ore in self.engine.unlocked_ores(luck):
+            price = self.engine.market.price(ore, now)
+            self.ui.print(f"- {ore.color}{ore.name}{Color.END} (Value: {price:.0f} coins{self.market_note(ore, now)})")
         
-        next_ore = next((ore for ore in self.ores if ore["min_luck"] > luck), None)
+        next_ore = self.engine.ores.next_locked(luck)
         if next_ore:
-            print(f"\nNext ore at luck {next_ore['min_luck']}: {next_ore['color']}{next_ore['name']}{Color.END}")
+            self.ui.print(f"\nNext ore at luck {next_ore.min_luck}: {next_ore.color}{next_ore.name}{Color.END}")
         
         self.wait_for_key()
     
     def show_stats(self):
-        self.clear_screen()
+        self.clear_screen("show_stats")
         self.display_header()
         
-        print(f"\n{Color.BLUE}STATS{Color.END}")
-        print(f"Total mines: {self.data.get('drills_used', 0)}")
+        self.ui.print(f"\n{Color.BLUE}STATS{Color.END}")
+        self.ui.print(f"Total mines: {self.data.get('drills_used', 0)}")
         
-        drills = list(self.drill_costs.keys())
-        current_drill = self.data.get("drill")
-        drill_idx = drills.index(current_drill)
+        drills = self.engine.content.drills
+        drill_idx = self.engine.drill_tier()
         drill_progress = f"{drill_idx + 1}/{len(drills)}"
         
         luck = self.data.get("luck")
-        luck_progress = f"{luck}/20"
+        luck_progress = f"{luck}/{self.engine.max_luck}"
+        
+        self.ui.print(f"Luck progress: {luck_progress}")
+        self.ui.print(f"Drill progress: {drill_progress}")
+        
+        stats = self.engine.stats
+        self.ui.print(f"Coins earned: {self.data.get('stats')['coins']} "
+                      f"({stats.coins_per_hour():.0f} coins/hour of drilling)")
+        
+        rows = stats.rates(luck)
+        if any(found for _, found, _, _ in rows):
+            self.ui.print(f"\n{Color.BLUE}FINDS AT LUCK {luck}{Color.END} (observed / expected rate)")
+            for ore, found, observed, expected in rows:
+                self.ui.print(f"{ore.color}{ore.name}{Color.END}: {found} ({observed:.1%} / {expected:.1%})")
+        
+        streaks = stats.dry_streaks(luck)
+        if streaks:
+            self.ui.print(f"\n{Color.BLUE}DRY STREAKS{Color.END}")
+            for ore, current, longest in streaks:
+                self.ui.print(f"{ore.color}{ore.name}{Color.END}: {current} digs since the last one, longest {longest}")
         
-        print(f"Luck progress: {luck_progress}")
-        print(f"Drill progress: {drill_progress}")
+        if self.data.history is not None:
+            self.ui.print(f"\nHistory: {len(self.data.history)} digs logged")
         
         self.wait_for_key()
     
+    def show_leaderboard(self):
+        board = self.data.board
+        metrics = list(Leaderboard.METRICS)
+        metric = "coins"
+        # Put this save's latest numbers on the board first
+        self.data.flush()
+        while True:
+            self.clear_screen("show_leaderboard")
+            self.display_header()
+            
+            if board is None:
+                self.ui.print(f"\n{Color.YELLOW}This save isn't on the leaderboard{Color.END}")
+                self.wait_for_key()
+                return
+            
+            self.ui.print(f"\n{Color.BLUE}LEADERBOARD - {Leaderboard.METRICS[metric]}{Color.END} "
+                          f"({len(board)} miners)")
+            me = self.data.storage.board_key
+            for place, (source, profile, name, score) in enumerate(board.top(metric), 1):
+                line = f"{place:>2}. {name} ({Leaderboard.label(source, profile)}): {score}"
+                self.ui.print(f"{Color.GREEN}{line}{Color.END}" if (source, profile) == me else line)
+            rank = board.rank(metric, me)
+            if rank:
+                self.ui.print(f"\nYour rank: {rank}")
+            
+            self.ui.print("\nRank by:")
+            for i, name in enumerate(metrics, 1):
+                self.ui.print(f"{i}) {Leaderboard.METRICS[name]}")
+            self.ui.print("0) Back")
+            choice = self.ui.input("> ")
+            if choice == '0':
+                return
+            if choice.isdigit() and 1 <= int(choice) <= len(metrics):
+                metric = metrics[int(choice) - 1]
+    
     def show_settings(self):
         while True:
-            self.clear_screen()
+            self.clear_screen("show_settings")
             self.display_header()
             
-            print(f"\n{Color.BLUE}SETTINGS{Color.END}")
-            print("1) Change miner name")
-            print("2) Reset game")
-            print("0) Back")
+            self.ui.print(f"\n{Color.BLUE}SETTINGS{Color.END}")
+            self.ui.print("1) Change miner name")
+            self.ui.print("2) Reset game")
+            instant = self.data.get("instant_mining")
+            self.ui.print(f"3) Mining animation: {'Instant' if instant else 'Normal'}")
+            auto_drill = self.data.get("auto_drill")
+            self.ui.print(f"4) Auto-drill while away: {'On' if auto_drill else 'Off'}")
+            self.ui.print("0) Back")
             
-            choice = input("> ")
+            choice = self.ui.input("> ")
             
             if choice == '1':
-                print("\nEnter new miner name:")
-                new_name = input("> ").strip()
+                self.ui.print("\nEnter new miner name:")
+                new_name = self.ui.input("> ").strip()
                 if new_name:
                     self.data.set("name", new_name)
-                    print(f"{Color.GREEN}Name changed to {new_name}{Color.END}")
+                    self.ui.print(f"{Color.GREEN}Name changed to {new_name}{Color.END}")
                 else:
-                    print(f"{Color.YELLOW}Name unchanged{Color.END}")
+                    self.ui.print(f"{Color.YELLOW}Name unchanged{Color.END}")
                 self.wait_for_key()
                 
             elif choice == '2':
-                print(f"{Color.RED}WARNING: This will delete all progress!{Color.END}")
-                print("Type 'reset' to confirm:")
-                confirm = input("> ")
+                self.ui.print(f"{Color.RED}WARNING: This will delete all progress!{Color.END}")
+                self.ui.print("Type 'reset' to confirm:")
+                confirm = self.ui.input("> ")
                 
                 if confirm.lower() == 'reset':
                     self.data.reset()
-                    print(f"{Color.GREEN}Game reset complete{Color.END}")
+                    self.ui.print(f"{Color.GREEN}Game reset complete{Color.END}")
                     self.wait_for_key()
                     return True  # Signal game reset
                 else:
-                    print("Reset cancelled")
+                    self.ui.print("Reset cancelled")
                 self.wait_for_key()
                 
+            elif choice == '3':
+                self.data.set("instant_mining", not instant)
+                
+            elif choice == '4':
+                self.data.set("auto_drill", not auto_drill)
+                
             elif choice == '0':
                 break
                 
             else:
-                print(f"{Color.RED}Invalid choice{Color.END}")
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
                 self.wait_for_key()
         
         return False
     
+    def show_profile(self):
+        # Hidden menu entry: hot-path counters and timers so far
+        self.clear_screen("show_profile")
+        if not PROFILER.enabled:
+            self.ui.print(f"{Color.YELLOW}Profiling is off. Start with --perf or DRILLING_PERF=1{Color.END}")
+        else:
+            self.ui.print(f"{Color.BOLD}PROFILE{Color.END}")
+            for line in PROFILER.summary_lines():
+                self.ui.print(line)
+        self.wait_for_key()
+    
     def main_loop(self):
         while True:
-            self.clear_screen()
+            # Another terminal may be playing the same save
+            self.data.sync()
+            self.clear_screen("main_loop")
             self.display_header()
+            if self.notices:
+                self.ui.print()
+                for line in self.notices:
+                    self.ui.print(line)
+                self.notices = []
             
-            print("\nMAIN MENU:")
-            print("1) Mine")
-            print("2) Inventory")
-            print("3) Shop")
-            print("4) Stats")
-            print("5) Settings")
-            print("0) Exit")
+            self.ui.print("\nMAIN MENU:")
+            self.ui.print("1) Mine")
+            self.ui.print("2) Inventory")
+            self.ui.print("3) Shop")
+            self.ui.print("4) Stats")
+            self.ui.print("5) Settings")
+            self.ui.print("6) Leaderboard")
+            self.ui.print("0) Exit")
             
-            choice = input("> ")
+            choice = self.ui.input("> ")
             
             if choice == '1':
                 self.mine()
@@ -579,23 +3192,656 @@ class MiningGame:
             elif choice == '5':
                 if self.show_settings():
                     # Reset happened, reinitialize
-                    self.__init__()
+                    self.__init__(self.data, self.ui, seed=self.rng.getrandbits(63), clock=self.clock)
+            elif choice == '6':
+                self.show_leaderboard()
+            elif choice == '9':
+                self.show_profile()
             elif choice == '0':
-                print(f"{Color.GREEN}Thanks for playing!{Color.END}")
+                self.ui.print(f"{Color.GREEN}Thanks for playing!{Color.END}")
                 break
             else:
-                print(f"{Color.RED}Invalid choice{Color.END}")
+                self.ui.print(f"{Color.RED}Invalid choice{Color.END}")
                 self.wait_for_key()
 
-def main():
+class Strategy:
+    # Greedy: buy luck whenever affordable, drills next, rest when empty
+    name = "greedy"
+    order = ("luck", "drill")
+
+    def next_purchase(self, engine):
+        for upgrade in self.order:
+            if upgrade == "luck" and engine.data.get("luck") < engine.max_luck:
+                return upgrade, engine.luck_cost(engine.data.get("luck"))
+            if upgrade == "drill":
+                next_drill, cost = engine.next_drill()
+                if next_drill:
+                    return upgrade, cost
+            if upgrade == "energy":
+                return upgrade, engine.energy_cost(engine.data.get("max_energy") // 100)
+        return None, None
+
+    def should_sell(self, engine, cost):
+        return engine.appraise()[1] + engine.data.get("coins") >= cost
+
+    def should_rest(self, engine):
+        return True
+
+class DrillFirstStrategy(Strategy):
+    name = "drill-first"
+    order = ("drill", "luck")
+
+class EnergyStrategy(Strategy):
+    # Grows the energy pool after each luck level, up to a cap
+    name = "energy"
+    max_energy = 300
+
+    def next_purchase(self, engine):
+        upgrade, cost = super().next_purchase(engine)
+        if upgrade == "luck" and engine.data.get("max_energy") < min(self.max_energy, 100 + 25 * engine.data.get("luck")):
+            return "energy", engine.energy_cost(engine.data.get("max_energy") // 100)
+        return upgrade, cost
+
+class PatientStrategy(Strategy):
+    # Never rests, waits for energy to regenerate instead
+    name = "patient"
+
+    def should_rest(self, engine):
+        return False
+
+STRATEGIES = {strategy.name: strategy for strategy in (Strategy, DrillFirstStrategy, EnergyStrategy, PatientStrategy)}
+
+def career_milestones(engine):
+    milestones = [(drill, lambda data, drill=drill: data.get("drill") == drill)
+                  for drill in list(engine.drill_costs)[1:]]
+    for ore in engine.ores:
+        if ore.min_luck > 0:
+            milestones.append((f"{ore.name} unlocked",
+                               lambda data, luck=ore.min_luck: data.get("luck") >= luck))
+    milestones.append(("Career complete", lambda data: data.get("luck") >= engine.max_luck
+                       and engine.next_drill()[0] is None))
+    return milestones
+
+def run_career(rng, strategy, max_digs=10 ** 7):
+    """Play one career on a fresh in-memory profile.
+
+    Returns {milestone: (digs, coins earned, game seconds)}.
+    """
+    # A whole new engine, so no part of it can keep playing the previous career's profile
+    engine = GameEngine(UserDataManager(None), rng=rng)
+    data = engine.data
+    pending = career_milestones(engine)
+    reached = {}
+    earned = 0
+    game_time = 0.0
+    buyers = {"luck": engine.buy_luck, "drill": engine.buy_drill, "energy": engine.buy_energy}
+    # The market recovers over the career's own clock
+    engine.clock = lambda: game_time
+    # In-memory profile, so batch everything and skip the per-action saves
+    with data.transaction():
+        while pending and data.get("drills_used") < max_digs:
+            upgrade, cost = strategy.next_purchase(engine)
+            if upgrade and data.get("coins") >= cost:
+                buyers[upgrade]()
+            elif upgrade and strategy.should_sell(engine, cost) and data.get("inventory"):
+                earned += engine.sell_all().coins
+            elif data.get("energy") < BulkMiner.ENERGY_PER_DIG:
+                if strategy.should_rest(engine):
+                    while engine.rest().ok:
+                        pass
+                else:
+                    missing = data.get("max_energy") - data.get("energy")
+                    game_time += missing * engine.minutes_per_energy * 60
+                    data.set("energy", data.get("max_energy"))
+            else:
+                delta = engine.mine_fast()
+                earned += delta.coins
+                game_time += delta.drills_used * engine.drill_speed()
+            for milestone in [m for m in pending if m[1](data)]:
+                reached[milestone[0]] = (data.get("drills_used"), earned, game_time)
+                pending.remove(milestone)
+    return reached
+
+def simulate_chunk(task):
+    strategy_name, careers, seed = task
+    rng = random.Random(seed)
+    strategy = STRATEGIES[strategy_name]()
+    return [run_career(rng, strategy) for _ in range(careers)]
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def simulate(careers, strategy="greedy", workers=None, seed=None, chunk_size=500):
+    """Run careers across a process pool and summarize each milestone."""
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    tasks = []
+    for index, start in enumerate(range(0, careers, chunk_size)):
+        tasks.append((strategy, min(chunk_size, careers - start), seed + index))
+    samples = {}
+    with contextlib.ExitStack() as stack:
+        if workers == 1 or len(tasks) == 1:
+            chunks = map(simulate_chunk, tasks)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            chunks = executor.map(simulate_chunk, tasks)
+        for chunk in chunks:
+            for reached in chunk:
+                for milestone, values in reached.items():
+                    samples.setdefault(milestone, []).append(values)
+    
+    order = [name for name, _ in career_milestones(GameEngine(UserDataManager(None)))]
+    summary = {"careers": careers, "strategy": strategy, "seed": seed, "milestones": {}}
+    for milestone in order:
+        values = samples.get(milestone)
+        if not values:
+            continue
+        stats = {"reached": len(values)}
+        for column, series in zip(("digs", "coins", "seconds"), zip(*values)):
+            series = sorted(series)
+            stats[column] = {"mean": sum(series) / len(series), "p10": percentile(series, 0.1),
+                             "p50": percentile(series, 0.5), "p90": percentile(series, 0.9)}
+        summary["milestones"][milestone] = stats
+    return summary
+
+def print_simulation(summary):
+    print(f"{Color.BLUE}SIMULATION{Color.END} {summary['careers']} careers, "
+          f"strategy {summary['strategy']}, seed {summary['seed']}")
+    print(f"{'Milestone':<20} {'Reached':>8} {'Digs p10/p50/p90':>26} {'Coins p50':>10} {'Game time p50':>14}")
+    for milestone, stats in summary["milestones"].items():
+        digs = stats["digs"]
+        hours = stats["seconds"]["p50"] / 3600
+        print(f"{milestone:<20} {stats['reached']:>8} "
+              f"{digs['p10']:>8}/{digs['p50']:>8}/{digs['p90']:>8} "
+              f"{stats['coins']['p50']:>10} {hours:>12.2f} h")
+
+class GameServer:
+    # Line-based TCP server, one GameEngine per connection on a single event loop
+    COMMANDS = ("help", "status", "mine [count|all]", "fast", "inventory", "sell [all|ore]",
+                "buy luck|drill|energy", "rest", "quit")
+
+    def __init__(self, db=None, saves_dir="saves", pace=True, board=None):
+        self.db = db
+        self.saves_dir = saves_dir
+        self.pace = pace
+        self.board = board  # Leaderboard the players' saves go on, if any
+        self.active = set()
+        # All disk work runs on one thread so the event loop never waits on a save
+        self.saver = ThreadPoolExecutor(max_workers=1)
+
+    def open_profile(self, profile):
+        if self.db:
+            return UserDataManager(None, storage=SqliteStorage(self.db, profile), leaderboard=self.board)
+        os.makedirs(self.saves_dir, exist_ok=True)
+        return UserDataManager(os.path.join(self.saves_dir, f"{profile}.json"), leaderboard=self.board)
+
+    async def offload(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.saver, func, *args)
+
+    async def handle(self, reader, writer):
+        def send(*lines):
+            writer.write("".join(f"{line}\n" for line in lines).encode())
+        
+        profile = None
+        try:
+            writer.write(b"Miner name: ")
+            await writer.drain()
+            name = (await reader.readline()).decode(errors="replace").strip()
+            profile = "".join(c for c in name if c.isalnum() or c in "-_")[:32]
+            if not profile or profile in self.active:
+                send(f"{Color.RED}Name unavailable{Color.END}")
+                profile = None
+                return
+            self.active.add(profile)
+            data = await self.offload(self.open_profile, profile)
+            engine = GameEngine(data)
+            # Keep changes batched for the session, they are flushed off-loop after each command
+            with data.transaction():
+                try:
+                    if engine.data.get("name") != name:
+                        engine.data.set("name", name)
+                    away = engine.resume()
+                    send(f"Welcome, {name}! Type 'help' for commands.")
+                    if away.drills_used:
+                        gains = ", ".join(f"{ore} +{count}" for ore, count in away.ore_counts.items())
+                        send(f"{Color.GREEN}Your drill dug {away.drills_used} times while you were away{Color.END}: "
+                             f"{gains or 'nothing'} | +{away.coins} coins")
+                    if away.energy:
+                        send(f"{Color.GREEN}+{away.energy} energy regenerated while away{Color.END}")
+                    while True:
+                        writer.write(b"> ")
+                        await writer.drain()
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        words = line.decode(errors="replace").split()
+                        if words and words[0] == "quit":
+                            send("Bye!")
+                            break
+                        await self.run_command(engine, words, send, writer)
+                        await self.offload(data.flush)
+                finally:
+                    # Also when the client drops mid-command: saved off-loop, so leaving the
+                    # transaction finds nothing left to write on the event loop
+                    await self.offload(data.flush)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if profile:
+                self.active.discard(profile)
+            with contextlib.suppress(ConnectionError):
+                await writer.drain()
+            writer.close()
+
+    async def run_command(self, engine, words, send, writer):
+        data = engine.data
+        command, args = (words[0], words[1:]) if words else ("", [])
+        if command == "help":
+            send("Commands: " + ", ".join(self.COMMANDS))
+        elif command == "status":
+            send(f"Miner: {data.get('name')} | 💰 {data.get('coins')} | 🍀 {data.get('luck')} | "
+                 f"⚡ {data.get('energy')}/{data.get('max_energy')} | {data.get('drill')}")
+        elif command == "mine":
+            count = None if args and args[0] == "all" else int(args[0]) if args and args[0].isdigit() else 1
+            result = engine.mine(count)
+            if not result.ok:
+                send(f"{Color.RED}Cannot mine that many times{Color.END}")
+                return
+            drill_speed = engine.drill_speed()
+            for i, dig in enumerate(result.digs, 1):
+                event = f" ({dig.event}{f' +{dig.amount}' if dig.amount else ''})" if dig.event else ""
+                send(f"[{i}/{len(result.digs)}] Found: {dig.ore.color}{dig.ore.name}{Color.END}{event}")
+                if self.pace:
+                    await writer.drain()
+                    await asyncio.sleep(drill_speed)
+            send(f"{Color.GREEN}Mining complete!{Color.END} Energy: {data.get('energy')}/{data.get('max_energy')}")
+        elif command == "fast":
+            delta = engine.mine_fast()
+            gains = ", ".join(f"{name} +{count}" for name, count in delta.ore_counts.items())
+            send(f"Resolved {delta.drills_used} digs: {gains or 'nothing'} | +{delta.coins} coins")
+        elif command == "inventory":
+            rows, total_value = engine.appraise()
+            send(*(f"{ore.color}{ore.name}{Color.END}: {count} (Value: {value} coins)" for ore, count, value in rows),
+                 f"Total value: {total_value} coins")
+        elif command == "sell":
+            result = engine.sell_all() if not args or args[0] == "all" else engine.sell(" ".join(args))
+            if result.ok:
+                send(f"{Color.GREEN}Sold {sum(result.sold.values())} ores for {result.coins} coins{Color.END}")
+            else:
+                send(f"{Color.RED}Nothing to sell{Color.END}")
+        elif command == "buy" and args and args[0] in ("luck", "drill", "energy"):
+            result = {"luck": engine.buy_luck, "drill": engine.buy_drill, "energy": engine.buy_energy}[args[0]]()
+            if result.ok:
+                send(f"{Color.GREEN}Upgraded {args[0]} to {result.value}!{Color.END}")
+            else:
+                send(f"{Color.RED}{'Already maxed' if result.reason == 'maxed' else 'Not enough coins'}{Color.END}")
+        elif command == "rest":
+            result = engine.rest()
+            send(f"{Color.GREEN}Recovered {result.amount} energy{Color.END}" if result.ok
+                 else f"{Color.YELLOW}Energy already full!{Color.END}")
+        else:
+            send(f"{Color.RED}Unknown command, type 'help'{Color.END}")
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"{Color.GREEN}Serving Underground Miner on {host}:{port}{Color.END}")
+        async with server:
+            await server.serve_forever()
+
+async def load_test(host, port, clients, duration, command="mine 1"):
+    """Drive `clients` connections for `duration` seconds and collect latencies."""
+    latencies = []
+    digs = 0
+    
+    async def player(index):
+        nonlocal digs
+        reader, writer = await asyncio.open_connection(host, port)
+        await reader.readuntil(b": ")
+        writer.write(f"loadtest{index}\n".encode())
+        await reader.readuntil(b"> ")
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(f"{command}\n".encode())
+            response = await reader.readuntil(b"> ")
+            latencies.append(time.perf_counter() - start)
+            digs += response.count(b"Found:")
+            if b"Cannot mine" in response:
+                writer.write(b"rest\n")
+                await reader.readuntil(b"> ")
+        writer.write(b"quit\n")
+        await writer.drain()
+        writer.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(player(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"clients": clients, "seconds": elapsed, "digs": digs, "digs_per_second": digs / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None}
+
+class SessionRecorder:
+    # Logs the seed, the starting save, every answer typed and every market clock reading
+    # so the session can be replayed
+    VERSION = 2
+    
+    def __init__(self, path, data, seed, now):
+        self.path = path
+        self.session = {"version": self.VERSION, "seed": seed, "now": now.isoformat(),
+                        "numpy": np is not None, "start": copy.deepcopy(data.materialize()), "inputs": [],
+                        "clock": []}
+    
+    def clock(self):
+        now = time.time()
+        self.session["clock"].append(now)
+        return now
+    
+    def attach(self, ui):
+        read = ui.input
+        
+        def record(prompt=""):
+            answer = read(prompt)
+            self.session["inputs"].append(answer)
+            return answer
+        ui.input = record
+    
+    def save(self, data):
+        self.session["final"] = replay_state(data.materialize())
+        atomic_write(self.path, json.dumps(self.session, separators=(',', ':')))
+
+def replay_state(data):
+    # Wall-clock timestamps are the only part of a save a replay can't reproduce
+    return {key: value for key, value in data.items() if key != "last_played"}
+
+def replay_session(path):
+    """Re-run a recorded session headlessly and return (mismatched keys, inputs, seconds)."""
+    with open(path) as file:
+        session = json.load(file)
+    if session.get("numpy", False) != (np is not None):
+        print(f"{Color.YELLOW}Session was recorded {'with' if session.get('numpy') else 'without'} NumPy, "
+              f"fast resolves may not match{Color.END}")
+    data = UserDataManager(None)
+    data.data = data.upgrade(copy.deepcopy(session["start"]))
+    now = datetime.datetime.fromisoformat(session["now"])
+    # Version 1 sessions kept no clock readings, their sales all happen at the start time
+    clock = functools.partial(next, iter(session.get("clock", [])), now.timestamp())
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as null:
+        game = MiningGame(data, ScriptedRenderer(session["inputs"], stream=null), seed=session["seed"],
+                          now=now, clock=clock)
+        with contextlib.suppress(EOFError):
+            game.main_loop()
+        data.flush()
+    seconds = time.perf_counter() - start
+    expected = session.get("final", {})
+    actual = replay_state(data.data)
+    mismatched = sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+    return mismatched, len(session["inputs"]), seconds
+
+SCRIPT_COMMANDS = ("status", "mine [count|all]", "fast", "sell [all|ore]", "buy luck|drill|energy", "rest")
+
+def run_script_command(engine, words):
+    """Run one scripted command and return a JSON-ready result, no menus or pauses."""
+    data = engine.data
+    command, args = (words[0], words[1:]) if words else ("", [])
+    if command == "mine":
+        if args and args[0] != "all" and not args[0].isdigit():
+            return {"ok": False, "reason": "bad_count"}
+        result = engine.mine(None if args and args[0] == "all" else int(args[0]) if args else 1)
+        reply = {"ok": result.ok, "reason": result.reason, "digs": len(result.digs), "ore_counts": result.ore_counts,
+                 "coins": result.coins, "energy": result.energy, "capped": result.capped}
+    elif command == "fast":
+        delta = engine.mine_fast()
+        reply = {"ok": delta.drills_used > 0, "reason": "" if delta.drills_used else "no_energy",
+                 "digs": delta.drills_used, "ore_counts": delta.ore_counts, "coins": delta.coins,
+                 "energy": delta.energy}
+    elif command == "sell":
+        result = engine.sell_all() if not args or args[0] == "all" else engine.sell(" ".join(args))
+        reply = {"ok": result.ok, "reason": result.reason, "coins": result.coins, "sold": result.sold}
+    elif command == "buy" and args and args[0] in ("luck", "drill", "energy"):
+        result = {"luck": engine.buy_luck, "drill": engine.buy_drill, "energy": engine.buy_energy}[args[0]]()
+        reply = {"ok": result.ok, "reason": result.reason, "coins": result.coins, "value": result.value,
+                 "unlocked": [ore.name for ore in result.unlocked]}
+    elif command == "rest":
+        result = engine.rest()
+        reply = {"ok": result.ok, "reason": result.reason, "energy": result.amount}
+    elif command == "status":
+        reply = {"ok": True, "reason": "", "inventory": data.get("inventory")}
+    else:
+        return {"ok": False, "reason": "unknown_command"}
+    reply["state"] = {key: data.get(key) for key in ("coins", "energy", "max_energy", "luck", "drill")}
+    return reply
+
+def run_script(data, commands, out=print):
+    """Run commands (lists of words) against one profile, printing a JSON line each and saving once."""
+    engine = GameEngine(data)
+    with data.transaction():
+        engine.resume()
+        for words in commands:
+            reply = run_script_command(engine, words)
+            out(json.dumps({"command": " ".join(words), **reply}))
+    for error in data.take_errors():
+        print(error, file=sys.stderr)
+
+def script_commands(args):
+    # `mine 5000 --sell-all --buy luck` becomes mine, sell all, buy luck
+    if args.command == "batch":
+        return (line.split() for line in sys.stdin if line.strip() and not line.lstrip().startswith("#"))
+    commands = [[args.command, *args.args]]
+    if args.sell_all:
+        commands.append(["sell", "all"])
+    commands.extend(["buy", upgrade] for upgrade in args.buy)
+    if args.rest:
+        commands.append(["rest"])
+    return commands
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Underground Miner - a terminal mining game")
+    parser.add_argument("--save", default="user_data.json", help="path of the save file")
+    parser.add_argument("--journal", action="store_true",
+                        help="append changes to a journal next to the save instead of rewriting it")
+    parser.add_argument("--format", choices=("json", "binary"),
+                        help="save format for new saves; converts an existing save (default: detect, else json)")
+    parser.add_argument("--db", help="keep profiles in this SQLite database instead of a JSON file")
+    parser.add_argument("--profile", default="default", help="profile to play when using --db")
+    parser.add_argument("--seed", type=int, help="seed the game's random generator (default: random)")
+    parser.add_argument("--record", metavar="FILE", help="record the seed and every input to a session file")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="re-run a recorded session headlessly and check the final save matches")
+    parser.add_argument("--content", metavar="DIR",
+                        help="load ores, drills, events and upgrade curves from this directory (default: ./content)")
+    parser.add_argument("--leaderboard-db", metavar="FILE",
+                        help="leaderboard index shared by every save (default: ~/.drilling_leaderboard.db)")
+    parser.add_argument("--perf", action="store_true",
+                        help="time saves, mining rolls and menu renders, print a summary on exit "
+                             "(also enabled by DRILLING_PERF=1)")
+    parser.add_argument("--perf-dump", metavar="PREFIX",
+                        help="with profiling, also write PREFIX.json and a cProfile PREFIX.pstats")
+    commands = parser.add_subparsers(dest="command")
+    
+    sim = commands.add_parser("simulate", help="play many careers headlessly and report progression")
+    sim.add_argument("--careers", type=int, default=1000)
+    sim.add_argument("--strategy", choices=sorted(STRATEGIES), default="greedy")
+    sim.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    sim.add_argument("--seed", type=int, default=None)
+    sim.add_argument("--json", action="store_true", help="print the summary as JSON")
+    
+    plan = commands.add_parser("plan", help="print the optimal upgrade path for the save")
+    plan.add_argument("--goal", choices=UpgradePlanner.GOALS, default="complete")
+    plan.add_argument("--metric", choices=UpgradePlanner.METRICS, default="digs",
+                      help="minimize expected digs, drilling time or rests")
+    
+    migrate = commands.add_parser("migrate", help="import JSON or binary saves into a SQLite database")
+    migrate.add_argument("files", nargs="+", help="save files to import")
+    
+    commands.add_parser("profiles", help="list the profiles in the SQLite database")
+    
+    commands.add_parser("content", help="validate the content files and summarize them")
+    
+    board = commands.add_parser("leaderboard", help="rank every miner on this host")
+    board.add_argument("--by", choices=Leaderboard.METRICS, default="coins")
+    board.add_argument("--top", type=int, default=10)
+    board.add_argument("--rebuild", action="store_true",
+                       help="re-read every save on the board, plus SAVES and the --db profiles")
+    board.add_argument("saves", nargs="*", help="save files to add when rebuilding")
+    
+    serve = commands.add_parser("serve", help="host the game for many players over TCP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4000)
+    serve.add_argument("--saves-dir", default="saves", help="JSON saves per player when --db is not set")
+    serve.add_argument("--no-pace", action="store_true", help="send mining results without drill-speed pacing")
+    
+    # Scripted actions for bots and cron jobs: one JSON line per command, a single save at the end
+    chain = argparse.ArgumentParser(add_help=False)
+    chain.add_argument("--sell-all", action="store_true", help="then sell every ore")
+    chain.add_argument("--buy", action="append", default=[], choices=("luck", "drill", "energy"),
+                       help="then buy this upgrade (repeatable)")
+    chain.add_argument("--rest", action="store_true", help="then rest")
+    for name, usage in (("mine", "dig COUNT times, or 'all' until out of energy"),
+                        ("fast", "resolve digs until out of energy in one step"),
+                        ("sell", "sell 'all' or one ore by name"),
+                        ("buy", "buy luck, drill or energy"),
+                        ("rest", "recover a quarter of max energy"),
+                        ("status", "print coins, energy, upgrades and inventory")):
+        action = commands.add_parser(name, parents=[chain], help=usage)
+        action.add_argument("args", nargs="*")
+    commands.add_parser("batch", help="run one command per line from stdin (" + ", ".join(SCRIPT_COMMANDS) + ")")
+    
+    load = commands.add_parser("loadtest", help="open many connections to a server and measure throughput")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=4000)
+    load.add_argument("--clients", type=int, default=100)
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--send", default="mine 1", help="command each client repeats")
+    return parser.parse_args(argv)
+
+def show_leaderboard(args, content):
+    board = open_leaderboard(content, args.leaderboard_db)
+    if args.rebuild:
+        count = board.rebuild(args.saves, [args.db] if args.db else [])
+        print(f"{Color.GREEN}Rebuilt the leaderboard from {count} profiles{Color.END}")
+    print(f"{Color.BLUE}{Leaderboard.METRICS[args.by]}{Color.END}")
+    for place, (source, profile, name, score) in enumerate(board.top(args.by, args.top), 1):
+        print(f"{place:>3}. {name:<16} {score:>12}  {Leaderboard.label(source, profile)}")
+
+def open_board(args, content):
+    """The leaderboard the players' saves go on, None (with a warning) when it can't be opened."""
+    try:
+        return open_leaderboard(content, args.leaderboard_db)
+    except sqlite3.Error as error:
+        print(f"{Color.YELLOW}Leaderboard unavailable: {error}{Color.END}", file=sys.stderr)
+        return None
+
+def open_profile(args, background=False, board=None):
+    if args.db:
+        return UserDataManager(None, storage=SqliteStorage(args.db, args.profile), background=background,
+                               leaderboard=board)
+    return UserDataManager(args.save, journal=args.journal, save_format=args.format, background=background,
+                           leaderboard=board)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.content:
+        # Through the environment so simulator worker processes load the same tables
+        os.environ["DRILLING_CONTENT"] = args.content
+    try:
+        content = load_content()
+    except (OSError, ValueError) as error:
+        print(f"{Color.RED}Could not load game content: {error}{Color.END}")
+        sys.exit(1)
+    if args.command == "content":
+        print(f"{len(content.ores)} ores, {len(content.drill_costs)} drills, "
+              f"{len(content.events['weights'])} event types, luck up to {content.max_luck}")
+        return
+    if args.perf or args.perf_dump or os.environ.get("DRILLING_PERF", "") not in ("", "0"):
+        PROFILER.enable(cprofile=bool(args.perf_dump))
+    try:
+        dispatch(args, content)
+    finally:
+        if PROFILER.enabled:
+            print("\n".join(PROFILER.summary_lines()))
+            if args.perf_dump:
+                PROFILER.dump(args.perf_dump)
+                print(f"Profile written to {args.perf_dump}.json and {args.perf_dump}.pstats")
+
+def dispatch(args, content):
+    """Run the command line's subcommand, or the interactive game when there is none."""
+    if args.command == "simulate":
+        summary = simulate(args.careers, args.strategy, args.workers, args.seed)
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        else:
+            print_simulation(summary)
+        return
+    if args.command == "plan":
+        engine = GameEngine(open_profile(args))
+        print_plan(UpgradePlanner(engine).plan(args.goal, args.metric))
+        return
+    if args.command == "leaderboard":
+        show_leaderboard(args, content)
+        return
+    if args.command in ("migrate", "profiles") and not args.db:
+        print(f"{Color.RED}--db is required for {args.command}{Color.END}")
+        return
+    if args.command == "migrate":
+        try:
+            imported = migrate_json_saves(args.db, args.files)
+        except ValueError as error:
+            print(f"{Color.RED}{error}{Color.END}")
+            sys.exit(1)
+        print(f"{Color.GREEN}Imported {len(imported)} profiles into {args.db}{Color.END}")
+        return
+    if args.command == "serve":
+        server = GameServer(args.db, args.saves_dir, pace=not args.no_pace, board=open_board(args, content))
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(server.serve(args.host, args.port))
+        return
+    if args.command == "loadtest":
+        report = asyncio.run(load_test(args.host, args.port, args.clients, args.duration, args.send))
+        print(f"{report['clients']} clients, {report['digs']} digs in {report['seconds']:.1f}s: "
+              f"{report['digs_per_second']:.0f} digs/s, latency p50 {report['p50_ms']:.1f} ms, "
+              f"p99 {report['p99_ms']:.1f} ms")
+        return
+    if args.command == "profiles":
+        for profile, name, coins, luck, drill, drills_used in SqliteStorage.profiles(args.db):
+            print(f"{profile:<20} {name:<16} 💰 {coins:<8} 🍀 {luck:<3} {drill:<15} {drills_used} mines")
+        return
+    if args.command in ("mine", "fast", "sell", "buy", "rest", "status", "batch"):
+        run_script(open_profile(args, board=open_board(args, content)), script_commands(args))
+        return
+    if args.replay:
+        mismatched, inputs, seconds = replay_session(args.replay)
+        print(f"Replayed {inputs} inputs in {seconds:.3f}s")
+        if mismatched:
+            print(f"{Color.RED}Final state differs from the recording: {', '.join(mismatched)}{Color.END}")
+            sys.exit(1)
+        print(f"{Color.GREEN}Final state matches the recording{Color.END}")
+        return
+    game = None
+    recorder = None
     try:
-        game = MiningGame()
+        data = open_profile(args, background=True, board=open_board(args, content))
+        seed = random.randrange(1 << 63) if args.seed is None else args.seed
+        now = datetime.datetime.now()
+        if args.record:
+            recorder = SessionRecorder(args.record, data, seed, now)
+        game = MiningGame(data, seed=seed, now=now, clock=recorder.clock if recorder else time.time)
+        if recorder:
+            recorder.attach(game.ui)
         game.main_loop()
     except KeyboardInterrupt:
         print("\nGame interrupted. Saving progress...")
     except Exception as e:
         print(f"\nAn error occurred: {e}")
     finally:
+        if game:
+            game.ui.present()
+            game.data.flush()
+            for error in game.data.take_errors():
+                print(f"{Color.RED}{error}{Color.END}")
+            if recorder:
+                recorder.save(game.data)
+                print(f"Session recorded to {args.record}")
         print("Game exited.")
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""Several processes mining against one save at the same time.
+
+    python benchmarks/stress.py                                  # 4 processes, JSON save
+    python benchmarks/stress.py --processes 8 --format binary --background
+    python benchmarks/stress.py --journal --rounds 500
+
+Every process mines and sells in its own game and reports what it did; the final
+save must hold the sum of all of it (digs, coins, every ore count, the dig history, the
+mining stats and the market's sales pressure). Exits 1 when any increment was lost.
+"""
+import os
+import sys
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Drilling_Game as game  # noqa: E402
+
+def miner(path, options, results):
+    data = game.UserDataManager(path, journal=options.journal, save_format=options.format,
+                                background=options.background)
+    now = [time.time()]
+    engine = game.GameEngine(data, clock=lambda: now[0])
+    found = Counter()  # Ores into the inventory, double deposits included
+    dug = Counter()  # One per dig, as the stats count them
+    events = Counter()
+    sold = Counter()
+    sales = []  # (ore, count, when) for the market check
+    coins = digs = 0
+    for round in range(options.rounds):
+        data.sync()
+        now[0] = time.time()
+        with data.transaction():
+            # Bring the energy for this round, so other miners can't leave us short
+            data.add("energy", options.digs * game.BulkMiner.ENERGY_PER_DIG)
+            result = engine.mine(options.digs)
+            found.update(result.ore_counts)
+            # Sell half of our own commonest ore, never what the other miners found
+            unsold = found - sold
+            if round % 2 and unsold:
+                ore, count = unsold.most_common(1)[0]
+                sale = engine.sell(ore, count // 2 + 1)
+                sold.update(sale.sold)
+                coins += sale.coins
+                sales.extend((name, count, now[0]) for name, count in sale.sold.items())
+        coins += result.coins
+        digs += len(result.digs)
+        dug.update(dig.ore.name for dig in result.digs)
+        events.update(dig.event for dig in result.digs if dig.event)
+    data.flush()
+    results.put((digs, coins, dict(found - sold), dict(dug), dict(events), sales, data.take_errors()))
+
+def expected_market(sales, content):
+    # The same fold the game uses, over every process's sales in time order
+    rate = math.log(2) / content.market["half_life"]
+    market = {}
+    for name, count, when in sorted(sales, key=lambda sale: sale[2]):
+        market[name] = game.fold_decaying(market.get(name), count, when, rate)
+    return market
+
+def run(options):
+    root = tempfile.mkdtemp(prefix="miner-stress-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    path = os.path.join(root, "user_data.json")
+    try:
+        # Start from a save everyone can mine at, with luck so rarer ores show up too
+        data = game.UserDataManager(path, journal=options.journal, save_format=options.format)
+        data.set("luck", game.load_content().max_luck)
+        data.flush()
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=miner, args=(path, options, results))
+                   for _ in range(options.processes)]
+        for worker in workers:
+            worker.start()
+        reports = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        digs = sum(report[0] for report in reports)
+        coins = sum(report[1] for report in reports)
+        found = sum((Counter(report[2]) for report in reports), Counter())
+        dug = sum((Counter(report[3]) for report in reports), Counter())
+        events = sum((Counter(report[4]) for report in reports), Counter())
+        sales = [sale for report in reports for sale in report[5]]
+        errors = [error for report in reports for error in report[6]]
+        final_data = game.UserDataManager(path)
+        final = final_data.materialize()
+        problems = []
+        if len(final_data.history) != digs:
+            problems.append(f"history {len(final_data.history)} digs, expected {digs}")
+        if final["drills_used"] != digs:
+            problems.append(f"drills_used {final['drills_used']}, expected {digs}")
+        if final["coins"] != coins:
+            problems.append(f"coins {final['coins']}, expected {coins}")
+        for ore, count in sorted(found.items()):
+            if final["inventory"].get(ore, 0) != count:
+                problems.append(f"{ore} {final['inventory'].get(ore, 0)}, expected {count}")
+        stats = final["stats"]
+        luck = str(game.load_content().max_luck)
+        for label, have, want in (("stats digs", stats["digs"], digs),
+                                  (f"stats luck {luck} digs", stats["by_luck"].get(luck, {}).get("digs", 0), digs),
+                                  ("stats coins", stats["coins"], coins),
+                                  ("stats ores", Counter(stats["ores"]), +dug),
+                                  (f"stats luck {luck} ores", Counter(stats["by_luck"].get(luck, {}).get("ores", {})),
+                                   +dug),
+                                  ("stats events", Counter(stats["events"]), +events)):
+            if have != want:
+                problems.append(f"{label} {have}, expected {want}")
+        market = expected_market(sales, game.load_content())
+        for ore in sorted(set(market) | set(final["market"])):
+            have = final["market"].get(ore, [0.0, 0.0])
+            want = market.get(ore, [0.0, 0.0])
+            if not (math.isclose(have[0], want[0], rel_tol=1e-9) and have[1] == want[1]):
+                problems.append(f"market {ore} {have}, expected {want}")
+        print(f"{options.processes} processes, {digs} digs, {coins} coins, {sum(found.values())} ores, "
+              f"{len(sales)} sales")
+        for error in errors:
+            print(f"save error: {error}")
+        return problems
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that concurrent games on one save lose nothing")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=200, help="mining actions per process")
+    parser.add_argument("--digs", type=int, default=10, help="digs per mining action")
+    parser.add_argument("--format", choices=("json", "binary"), default="json")
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--background", action="store_true", help="save on a background thread like the game")
+    options = parser.parse_args(argv)
+    problems = run(options)
+    if problems:
+        print(f"Lost increments: {'; '.join(problems)}")
+        return 1
+    print("No increments lost")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""Content that the game can't play is refused when it loads, not halfway through a dig."""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Drilling_Game as game  # noqa: E402
+
+def raw_tables():
+    tables = {}
+    for name in game.CONTENT_FILES:
+        with open(os.path.join(game.CONTENT_DIR, f"{name}.json")) as file:
+            tables[name] = json.load(file)
+    return tables
+
+def test_shipped_content_is_valid():
+    assert game.validate_content(raw_tables()) == []
+
+def test_luck_beyond_the_history_column_is_refused():
+    tables = raw_tables()
+    tables["upgrades"]["luck"]["max"] = game.MiningHistory.MAX_LUCK + 1
+    assert any("luck.max" in problem for problem in game.validate_content(tables))
+    tables["upgrades"]["luck"]["max"] = game.MiningHistory.MAX_LUCK
+    assert game.validate_content(tables) == []
+
+def test_starting_drill_must_be_free():
+    tables = raw_tables()
+    tables["drills"][0]["cost"] = 10
+    assert any("starting drill" in problem for problem in game.validate_content(tables))
@@ -0,0 +1,63 @@
+"""The alias-table sampler must draw ores with the same odds as the cumulative-weight loop it replaced."""
+import os
+import sys
+import random
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Drilling_Game as game  # noqa: E402
+
+DRAWS = 20000  # Per sampler and luck level
+Z_CRITICAL = 3.9  # One-sided normal quantile for p = 0.001 spread over the 21 luck levels
+
+def cumulative_choice(ores, rng):
+    # The loop mine() used before the alias tables
+    total_weight = sum(ore.weight for ore in ores)
+    r = rng.uniform(0, total_weight)
+    cumulative = 0
+    for ore in ores:
+        cumulative += ore.weight
+        if r <= cumulative:
+            return ore
+    return ores[0]
+
+def chi_square_critical(df):
+    # Wilson-Hilferty approximation of the chi-square quantile
+    return df * (1 - 2 / (9 * df) + Z_CRITICAL * (2 / (9 * df)) ** 0.5) ** 3
+
+def two_sample_chi_square(first, second, categories):
+    # Equal sample sizes: sum of (a - b)^2 / (a + b) over the categories either sample hit
+    return sum((first[c] - second[c]) ** 2 / (first[c] + second[c]) for c in categories if first[c] + second[c])
+
+def test_alias_table_matches_cumulative_loop_at_every_luck_level():
+    content = game.load_content()
+    sampler = game.OreSampler(content.ores, content.max_luck)
+    rng = random.Random(1234)
+    assert content.max_luck == 20
+    for luck in range(content.max_luck + 1):
+        ores = content.ores.unlocked(luck)
+        alias = Counter(ore.name for ore in sampler.sample(luck, DRAWS, rng))
+        reference = Counter(cumulative_choice(ores, rng).name for _ in range(DRAWS))
+        names = [ore.name for ore in ores]
+        statistic = two_sample_chi_square(alias, reference, names)
+        if len(names) > 1:
+            assert statistic < chi_square_critical(len(names) - 1), (luck, statistic)
+        assert set(alias) <= set(names)
+
+def test_choose_and_sample_draw_the_same_distribution():
+    content = game.load_content()
+    sampler = game.OreSampler(content.ores, content.max_luck)
+    luck = content.max_luck
+    names = [ore.name for ore in content.ores.unlocked(luck)]
+    rng = random.Random(99)
+    single = Counter(sampler.choose(luck, rng).name for _ in range(DRAWS))
+    bulk = Counter(ore.name for ore in sampler.sample(luck, DRAWS, rng))
+    assert two_sample_chi_square(single, bulk, names) < chi_square_critical(len(names) - 1)
+
+def test_tables_are_rebuilt_when_the_ores_change():
+    content = game.load_content()
+    sampler = game.OreSampler(content.ores, content.max_luck)
+    assert sampler.table(0)[0] == content.ores.unlocked(0)
+    only_coal = game.OreRegistry([{"name": "Coal", "price": 1, "min_luck": 0, "weight": 1}])
+    sampler.set_ores(only_coal)
+    assert [ore.name for ore in sampler.sample(5, 100, random.Random(0))] == ["Coal"] * 100
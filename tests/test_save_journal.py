@@ -0,0 +1,46 @@
+"""A crash at any point of a journal append or compaction must never apply a change twice."""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Drilling_Game as game  # noqa: E402
+
+def journal_lines(storage):
+    with open(storage.journal_path) as file:
+        return [json.loads(line) for line in file]
+
+def test_append_after_a_torn_first_append_starts_with_a_header(tmp_path):
+    storage = game.JsonStorage(str(tmp_path / "save.json"), journal=True)
+    storage.write({"coins": 0})
+    # The first append tore before its first record and was truncated to nothing
+    open(storage.journal_path, 'wb').close()
+    storage.commit({"coins": 5}, [["add", "coins", 5]])
+    assert journal_lines(storage) == [{"base": storage.journal_seq}, ["add", "coins", 5]]
+
+def test_empty_journal_is_removed_on_load(tmp_path):
+    storage = game.JsonStorage(str(tmp_path / "save.json"), journal=True)
+    storage.write({"coins": 3})
+    open(storage.journal_path, 'wb').close()
+    assert game.JsonStorage(storage.file_path, journal=True).load() == {"coins": 3}
+    assert not os.path.exists(storage.journal_path)
+
+def test_crash_before_the_journal_is_removed_does_not_replay_it(tmp_path, monkeypatch):
+    storage = game.JsonStorage(str(tmp_path / "save.json"), journal=True)
+    storage.write({"coins": 0})
+    open(storage.journal_path, 'wb').close()
+    storage.commit({"coins": 5}, [["add", "coins", 5]])
+    # Compaction writes the snapshot, then dies before removing the journal
+    monkeypatch.setattr(os, "remove", lambda path: None)
+    storage.write({"coins": 5})
+    monkeypatch.undo()
+    assert game.JsonStorage(storage.file_path, journal=True).load() == {"coins": 5}
+
+def test_torn_tail_is_dropped_and_the_rest_replayed(tmp_path):
+    storage = game.JsonStorage(str(tmp_path / "save.json"), journal=True)
+    storage.write({"coins": 0})
+    storage.commit({"coins": 2}, [["add", "coins", 2]])
+    with open(storage.journal_path, 'ab') as file:
+        file.write(b'["add","coi')
+    assert game.JsonStorage(storage.file_path, journal=True).load() == {"coins": 2}
+    assert len(journal_lines(storage)) == 2
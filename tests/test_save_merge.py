@@ -0,0 +1,121 @@
+"""Saves written by several processes merge their changes instead of the last writer winning."""
+import os
+import sys
+import math
+import random
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Drilling_Game as game  # noqa: E402
+
+RATE = math.log(2) / 600
+
+def changes_of(*ops):
+    changes = game.SaveChanges()
+    for op in ops:
+        changes.note(*op)
+    return changes
+
+def test_fold_decaying_gives_the_same_total_in_any_order():
+    sales = [(3, 100.0), (5, 40.0), (1, 700.0), (2, 100.0)]
+    totals = []
+    for order in itertools.permutations(sales):
+        entry = None
+        for amount, when in order:
+            entry = game.fold_decaying(entry, amount, when, RATE)
+        totals.append(entry)
+    for amount, when in totals:
+        assert when == 700.0
+        assert math.isclose(amount, totals[0][0], rel_tol=1e-12)
+    expected = sum(amount * math.exp(-RATE * (700.0 - when)) for amount, when in sales)
+    assert math.isclose(totals[0][0], expected, rel_tol=1e-12)
+
+def test_apply_op_walks_nested_paths():
+    data = {"stats": {"ores": {}}}
+    game.apply_op(data, ("add", ["stats", "ores", "Gold"], 2))
+    game.apply_op(data, ("add", ["stats", "ores", "Gold"], 1))
+    game.apply_op(data, ("set", ["stats", "dry", "Gold"], [4, 1]))
+    game.apply_op(data, ("decay", ["market", "Gold"], [3, 10.0, RATE]))
+    game.apply_op(data, ("inv", "Gold", 2))
+    game.apply_op(data, ("inv", "Gold", -2))
+    assert data == {"stats": {"ores": {"Gold": 3}, "dry": {"Gold": [4, 1]}}, "market": {"Gold": [3, 10.0]},
+                    "inventory": {}}
+
+def test_apply_adds_sums_and_sets_on_top_of_theirs():
+    theirs = {"coins": 10, "name": "Theirs", "inventory": {"Coal": 4, "Iron": 1},
+              "stats": {"digs": 7, "ores": {"Coal": 7}}}
+    ours = {"coins": 3, "name": "Ours", "inventory": {"Iron": 0}, "stats": {"digs": 2, "ores": {"Coal": 2}}}
+    changes = changes_of(("add", "coins", 3), ("set", "name", "Ours"), ("inv", "Iron", -1), ("inv", "Coal", 2),
+                         ("add", ["stats", "digs"], 2), ("add", ["stats", "ores", "Coal"], 2))
+    merged = changes.apply(theirs, ours)
+    assert merged == {"coins": 13, "name": "Ours", "inventory": {"Coal": 6},
+                      "stats": {"digs": 9, "ores": {"Coal": 9}}}
+    # Theirs is left as it was: its containers may be shared with a snapshot
+    assert theirs["stats"] == {"digs": 7, "ores": {"Coal": 7}} and theirs["inventory"] == {"Coal": 4, "Iron": 1}
+
+def test_a_set_parent_covers_the_adds_below_it():
+    theirs = {"stats": {"digs": 50, "ores": {"Coal": 50}}}
+    ours = {"stats": {"digs": 1, "ores": {}}}
+    changes = changes_of(("add", ["stats", "digs"], 1), ("set", "stats", ours["stats"]))
+    assert changes.apply(theirs, ours) == {"stats": {"digs": 1, "ores": {}}}
+
+def test_apply_folds_market_sales_from_both_sides():
+    theirs = {"market": {"Gold": [4.0, 100.0]}}
+    ours = {"market": {"Gold": [9.0, 50.0]}}
+    changes = changes_of(("decay", ["market", "Gold"], [2, 50.0, RATE]), ("decay", ["market", "Iron"], [1, 60.0, RATE]))
+    merged = changes.apply(theirs, ours)
+    assert merged["market"]["Gold"] == game.fold_decaying([4.0, 100.0], 2, 50.0, RATE)
+    assert merged["market"]["Iron"] == [1, 60.0]
+
+def test_combine_matches_applying_each_in_turn():
+    theirs = {"coins": 1, "market": {}, "inventory": {}}
+    first = changes_of(("add", "coins", 2), ("decay", ["market", "Coal"], [5, 10.0, RATE]), ("inv", "Coal", 3))
+    second = changes_of(("add", "coins", 4), ("decay", ["market", "Coal"], [1, 30.0, RATE]), ("inv", "Coal", -1))
+    one_by_one = second.apply(first.apply(theirs, {}), {})
+    combined = first.combine(second).apply(theirs, {})
+    assert combined["coins"] == one_by_one["coins"] == 7
+    assert combined["inventory"] == one_by_one["inventory"] == {"Coal": 2}
+    assert math.isclose(combined["market"]["Coal"][0], one_by_one["market"]["Coal"][0], rel_tol=1e-12)
+
+def test_two_managers_on_one_save_lose_nothing(tmp_path):
+    path = str(tmp_path / "save.json")
+    first = game.UserDataManager(path)
+    second = game.UserDataManager(path)
+    for i in range(10):
+        first.add("coins", 1)
+        second.add("coins", 10)
+        first.add(["stats", "ores", "Coal"], 1)
+        second.update_inventory("Iron", 2)
+        second.add_decaying(["market", "Iron"], 2, 100.0 + i, RATE)
+    final = game.UserDataManager(path).materialize()
+    assert final["coins"] == 110
+    assert final["stats"]["ores"]["Coal"] == 10
+    assert final["inventory"] == {"Iron": 20}
+    assert final["market"]["Iron"][1] == 109.0
+
+def test_journal_replays_nested_and_decaying_ops(tmp_path):
+    path = str(tmp_path / "save.json")
+    data = game.UserDataManager(path, journal=True)
+    engine = game.GameEngine(data, rng=random.Random(3), clock=lambda: 1000.0)
+    data.set("energy", 200)
+    engine.mine(20)
+    engine.sell_all()
+    assert os.path.exists(path + ".journal")
+    assert game.UserDataManager(path, journal=True).materialize() == data.data
+
+def test_reset_drops_a_merge_still_waiting_to_be_adopted(tmp_path):
+    path = str(tmp_path / "save.json")
+    data = game.UserDataManager(path, background=True)
+    other = game.UserDataManager(path)
+    data.set("coins", 10)
+    data.flush()
+    other.sync()
+    other.set("coins", 50)
+    data.set("name", "Zed")
+    data.flush()
+    data.reset()
+    data.sync()
+    data.set("energy", 90)
+    data.flush()
+    assert (data.get("coins"), data.get("name")) == (0, "Miner")
+    assert game.UserDataManager(path).get("coins") == 0